@@ -19,14 +19,13 @@
 # This is a tutorial in the form of a real output filter module -- you can
 # actually drop it into the MorkDB/filters directory and use it as-is.
 
-import sys
-
 # The Filter class isn't actually required for writing filters, but it
 # describes the basic interface and is kind of handy.
 from filterbase import Filter
-# EncodingStream is a helper for doing output in whatever character encoding
-# the user asks for.
-from encoding import EncodingStream
+# open_output is a helper for doing output in whatever character encoding
+# the user asks for. It returns an EncodingStream, which buffers what's
+# written to it, so it has to be closed at the end.
+from encoding import open_output
 
 # All filters require three items:
 #   mork_filter_order - an integer value used for identifying and ordering
@@ -55,6 +54,13 @@ class TutorialFilter(Filter):
     # final say in setting default options).
     mork_filter_order = 10001
 
+    # These optional attributes tell the driver which option enables the
+    # filter, so it can skip the filter without calling process at all. The
+    # filter still has to check opts itself in process, since it may be used
+    # by code that doesn't do this planning.
+    enable_option = 'out_format'
+    enable_value = 'text'
+
     # add_options is invoked early during construction of the
     # optparser.OptionParser instance. This allows filters to provide their
     # own command-line options, and sometimes to override default option
@@ -96,13 +102,10 @@ class TutorialFilter(Filter):
         # some understanding of the MorkDatabase class's internals.
 
         # outname is a common option for describing the output name (file,
-        # directory, or whatever). Here we use '-' or the absence of outname
-        # to select stdout.
-        outname = opts.outname or '-'
-        if outname == '-':
-            f = EncodingStream(opts.out_encoding, sys.stdout)
-        else:
-            f = EncodingStream.open(opts.out_encoding, outname)
+        # directory, or whatever). open_output uses stdout for '-' or the
+        # absence of outname, and compresses names ending in '.gz' (the
+        # options say how).
+        f = open_output(opts.out_encoding, opts.outname, opts)
 
         if opts.tabs:
             indent = '\t'
@@ -118,6 +121,10 @@ class TutorialFilter(Filter):
             # recommend this in general, since they may contain useful data.
             cls._write_table(f, namespace, oid, table, indent)
 
+        # This writes out anything still buffered. Closing stdout this way
+        # just flushes it.
+        f.close()
+
     @classmethod
     def _write_table(cls, f, namespace, oid, table, indent):
         print >> f, 'TABLE (namespace: %s, id: %s)' % (namespace, oid)
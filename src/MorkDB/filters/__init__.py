@@ -18,47 +18,447 @@ import os
 import sys
 import re
 
+import parallel
+import streaming
+import manifest
+from MorkDB.monitor import database_counts, TimeProbe
+
 _module_blacklist = re.compile(r'''
       ^\.          # starts with dot
     | ^__          # starts with __
 ''', re.VERBOSE)
 
-def _find_modules():
+def _module_entries(directory):
+    # { 'module name' : ['directory entry'] }
+    modules = {}
+    for entry in os.listdir(directory):
+        if _module_blacklist.search(entry):
+            continue
+        modules.setdefault(entry.split('.', 1)[0], []).append(entry)
+
+    return modules
+
+def _import_module(module_name):
+    # This is based on the discussion of __import__ in the Python
+    # Library Reference.
+    try:
+        __import__(module_name)
+    except ImportError:
+        return None
+    else:
+        return sys.modules[module_name]
+
+def _module_filters(module):
+    filters = []
+    for (name, obj) in vars(module).items():
+        if hasattr(obj, 'mork_filter_order') and obj.mork_filter_order >= 0:
+            filters.append((name, obj))
+
+    return filters
+
+def _find_filters():
     # Use __path__[0] to find module files, __name__ for importing
     directory = __path__[0]
     package = __name__
 
-    dir_entries = os.listdir(directory)
-    modules = [name.split('.', 1)[0] for name in dir_entries
-               if not _module_blacklist.search(name)]
+    # If nothing has changed since the manifest was written, the filter
+    # modules aren't imported. The manifest describes their filters, which
+    # are loaded when they're needed. Otherwise every module is imported to
+    # find its filters, and the manifest is rebuilt.
+    modules = _module_entries(directory)
+    signature = manifest.package_signature(directory, modules)
 
-    for m in modules:
-        module_name = '%s.%s' % (package, m)
-        # This is based on the discussion of __import__ in the Python
-        # Library Reference.
-        try:
-            __import__(module_name)
-        except ImportError:
-            pass
+    old_manifest = manifest.read_manifest(directory)
+    if old_manifest.get('signature') == signature:
+        for (m, records) in sorted(old_manifest['modules'].items()):
+            for record in records:
+                yield manifest.LazyFilter('%s.%s' % (package, m), record)
+        to_import = old_manifest['import']
+    else:
+        to_import = sorted(modules)
+
+    new_manifest = {'signature': signature, 'modules': {}, 'import': []}
+    for m in to_import:
+        module = _import_module('%s.%s' % (package, m))
+        if module is None:
+            new_manifest['import'].append(m)
+            continue
+
+        filters = _module_filters(module)
+        for (name, obj) in filters:
+            yield obj
+
+        records = manifest.describe_filters(filters)
+        if records is None:
+            new_manifest['import'].append(m)
         else:
-            yield sys.modules[module_name]
+            new_manifest['modules'][m] = records
+
+    if old_manifest.get('signature') != signature:
+        manifest.write_manifest(directory, new_manifest)
 
 _filters = None
 def enumerate_filters():
     global _filters
 
     if _filters is None:
-        filters = set()
-        for m in _find_modules():
-            for (name, obj) in vars(m).items():
-                if hasattr(obj, 'mork_filter_order') and \
-                   obj.mork_filter_order >= 0:
-                    filters.add(obj)
+        # A filter can show up more than once if one module imports it from
+        # another. Filters that were actually imported are preferred over
+        # stand-ins from the manifest.
+        filters = {} # { (order, name) : filter }
+        for obj in _find_filters():
+            key = (obj.mork_filter_order, filter_name(obj))
+            if key not in filters or \
+               isinstance(filters[key], manifest.LazyFilter):
+                filters[key] = obj
 
-        _filters = [(obj.mork_filter_order, obj) for obj in filters]
-        _filters.sort()
+        _filters = [(order, obj) for ((order, name), obj)
+                    in sorted(filters.items())]
 
     return _filters
 
 def list_filters():
     return [filt for (order, filt) in enumerate_filters()]
+
+def filter_name(filt):
+    '''
+    Return a name for filt, which may be a class or an instance.
+    '''
+    if hasattr(filt, '__name__'):
+        return filt.__name__
+    else:
+        return filt.__class__.__name__
+
+def _is_row_filter(filt):
+    return hasattr(filt, 'process_row') and hasattr(filt, 'start')
+
+def filter_enabled(filt, opts):
+    '''
+    Check the enable_option and enable_value hints of filt (see
+    filterbase.Filter) against opts.
+    '''
+    option = getattr(filt, 'enable_option', None)
+    if option is None:
+        return True
+
+    value = getattr(opts, option, None)
+    expected = getattr(filt, 'enable_value', True)
+    if isinstance(expected, bool):
+        return bool(value) == expected
+    else:
+        return value == expected
+
+def filter_namespaces(filt, opts):
+    '''
+    Return the set of row namespaces filt can change, or None if it may
+    change any namespace.
+    '''
+    namespaces = getattr(filt, 'row_namespaces', None)
+    if namespaces is None:
+        return None
+
+    namespaces = set(namespaces)
+    option = getattr(filt, 'namespace_option', None)
+    if option is not None:
+        extra = getattr(opts, option, None) or {}
+        namespaces.update([row_ns for (row_ns, column) in extra])
+
+    return namespaces
+
+def plan_filters(filters, db, opts):
+    '''
+    Return the filters that can have an effect on db with the given options,
+    leaving out filters that aren't enabled and filters that only handle row
+    namespaces db doesn't contain.
+    '''
+    present = set([row_ns for (row_ns, row_id) in db.rows.iterkeys()])
+
+    planned = []
+    for filt in filters:
+        if not filter_enabled(filt, opts):
+            continue
+
+        namespaces = filter_namespaces(filt, opts)
+        if namespaces is not None and not namespaces & present:
+            continue
+
+        planned.append(filt)
+
+    return planned
+
+# Rows handed to RowFilter.process_rows at a time by _FusedRowFilters.
+row_batch_size = 1000
+
+class _FusedRowFilters(object):
+    '''
+    Runs consecutive row filters in a single traversal of the database rows,
+    applying each filter to a batch of rows in mork_filter_order before
+    moving on to the next batch.
+    '''
+    def __init__(self, filters):
+        self.filters = filters
+        self.mork_filter_order = filters[0].mork_filter_order
+        self.__name__ = '+'.join([filter_name(filt) for filt in filters])
+        # Time spent in each filter, if time_members() asked for it.
+        self._member_times = None # { filter : {'wall' : ..., 'cpu' : ...} }
+
+    def time_members(self):
+        '''
+        Have the next run record the time spent in each filter, for
+        member_phases().
+        '''
+        self._member_times = {}
+
+    def member_phases(self):
+        '''
+        Return the time spent in each filter during the last run, as
+        PhaseMonitor-style records in filter order, or None if it wasn't
+        recorded. Work done in worker processes (see --jobs) can't be split
+        up this way.
+        '''
+        if self._member_times is None:
+            return None
+
+        return [{'name': 'filter:%s' % filter_name(filt),
+                 'order': filt.mork_filter_order,
+                 'time': self._member_times.get(filt,
+                                                {'wall': 0.0, 'cpu': 0.0})}
+                for filt in self.filters]
+
+    def _call(self, filt, function, *args):
+        # Call function (a method of filt), adding its time to filt's if
+        # member times are being recorded.
+        if self._member_times is None:
+            return function(*args)
+
+        probe = TimeProbe()
+        state = probe.start()
+        try:
+            return function(*args)
+        finally:
+            taken = probe.stop(state)
+            total = self._member_times.get(filt)
+            if total is None:
+                self._member_times[filt] = taken
+            else:
+                total['wall'] += taken['wall']
+                total['cpu'] += taken['cpu']
+
+    def _start(self, db, opts):
+        active = []
+        for filt in self.filters:
+            state = self._call(filt, filt.start, db, opts)
+            if state is not None:
+                active.append((filt, filter_namespaces(filt, opts), state))
+
+        return active
+
+    def _row_handlers(self, active, row_namespace):
+        return [(filt, state)
+                for (filt, namespaces, state) in active
+                if namespaces is None or row_namespace in namespaces]
+
+    def _process_batches(self, active, handlers, batches):
+        '''
+        Run the filters over batches, a dict mapping row namespaces to lists
+        of rows, then empty it. handlers caches _row_handlers results.
+        '''
+        for (row_namespace, rows) in batches.iteritems():
+            row_handlers = handlers.get(row_namespace)
+            if row_handlers is None:
+                row_handlers = handlers[row_namespace] = \
+                    self._row_handlers(active, row_namespace)
+
+            for (filt, state) in row_handlers:
+                self._call(filt, filt.process_rows, state, rows)
+
+        batches.clear()
+
+    def _finish(self, active):
+        for (filt, namespaces, state) in active:
+            self._call(filt, filt.finish, state)
+
+    def process(self, db, opts):
+        active = self._start(db, opts)
+        if not active:
+            return
+
+        jobs = parallel.jobs(opts)
+        if jobs > 1 and len(db.rows) > parallel.chunk_size:
+            detached = [(filt, namespaces, filt.detach(state))
+                        for (filt, namespaces, state) in active]
+            parallel.process_rows(db, detached, jobs)
+            self._member_times = None
+            return
+
+        # { 'row namespace' : [(filter, state)] }
+        handlers = {}
+        # { 'row namespace' : [(namespace, id, row)] }
+        batches = {}
+        count = 0
+        for item in db.rows.items():
+            batch = batches.get(item[0])
+            if batch is None:
+                batch = batches[item[0]] = []
+            batch.append(item)
+
+            count += 1
+            if count == row_batch_size:
+                self._process_batches(active, handlers, batches)
+                count = 0
+
+        self._process_batches(active, handlers, batches)
+        self._finish(active)
+
+    def stream(self, db, opts, events):
+        active = self._start(db, opts)
+        if not active:
+            return events
+
+        detached = [(filt, namespaces, filt.detach(state))
+                    for (filt, namespaces, state) in active]
+        return self._stream_rows(detached, streaming.shared_rows(db), events)
+
+    def _stream_rows(self, active, shared, events):
+        # Events are held back until a batch of rows has been filtered.
+        handlers = {}
+        batches = {}
+        count = 0
+        pending = []
+        seen = set()
+        for event in events:
+            for item in streaming.event_rows(event):
+                key = item[:2]
+                if key in shared:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+
+                batch = batches.get(item[0])
+                if batch is None:
+                    batch = batches[item[0]] = []
+                batch.append(item)
+                count += 1
+
+            pending.append(event)
+            if count >= row_batch_size:
+                self._process_batches(active, handlers, batches)
+                count = 0
+                for event in pending:
+                    yield event
+                del pending[:]
+
+        self._process_batches(active, handlers, batches)
+        for event in pending:
+            yield event
+
+        self._finish(active)
+
+def fuse_filters(filters):
+    '''
+    Return a new filter list in which each run of consecutive row filters
+    (see filterbase.RowFilter) is replaced by a single filter that applies
+    them all in one pass over the rows, spread over worker processes if
+    opts.jobs asks for it.
+    '''
+    result = []
+    group = []
+    for filt in filters + [None]:
+        if filt is not None and _is_row_filter(filt):
+            group.append(filt)
+            continue
+
+        if group:
+            result.append(_FusedRowFilters(group))
+        group = []
+
+        if filt is not None:
+            result.append(filt)
+
+    return result
+
+def _note_member_phases(monitor, filters):
+    # Add the times of the row filters run as part of filters (see
+    # _FusedRowFilters.member_phases) to the phase just finished.
+    phases = []
+    for filt in filters:
+        if isinstance(filt, _FusedRowFilters):
+            phases.extend(filt.member_phases() or [])
+
+    if phases:
+        monitor.note(filters=phases)
+
+def _can_stream(filters, opts):
+    if parallel.jobs(opts) > 1 or not getattr(opts, 'streaming', False):
+        return False
+
+    for filt in filters:
+        if not hasattr(filt, 'stream'):
+            return False
+
+    return True
+
+def stream_filters(db, filters, opts):
+    '''
+    Run filters (which must all have a stream method) as a pipeline over the
+    rows of db, releasing tables and rows as they pass out of the pipeline.
+    db is left empty. Returns the number of rows streamed.
+    '''
+    # This must be worked out before anything is released.
+    streaming.shared_rows(db)
+
+    events = streaming.events(db, release=True)
+    for filt in filters:
+        events = filt.stream(db, opts, events)
+
+    return streaming.drain(events)
+
+def run_filters(db, filters, opts, monitor=None):
+    '''
+    Apply filters to db in order, skipping those plan_filters finds to have
+    nothing to do. If opts.streaming asks for it and every filter that is
+    left can be streamed (and opts.jobs doesn't ask for worker processes),
+    they are run as a single pipeline that consumes db.
+
+    If monitor (a MorkDB.monitor.PhaseMonitor) is given, each filter (or the
+    pipeline) is recorded as a separate phase, with the row and cell counts
+    it leaves behind if the monitor wants counts. Row filters that share a
+    pass are one phase, with the time taken by each of them listed under
+    'filters' if the monitor measures time. Their memory use is only
+    measured as a group.
+    '''
+    # Only the filters that will actually run need to be imported.
+    planned = [manifest.load_filter(filt)
+               for filt in plan_filters(filters, db, opts)]
+    filters = fuse_filters(planned)
+
+    if monitor is not None and monitor.measures('time'):
+        for filt in filters:
+            if isinstance(filt, _FusedRowFilters):
+                filt.time_members()
+
+    if filters and _can_stream(filters, opts):
+        if monitor is not None:
+            monitor.start('stream:%s' % '+'.join([filter_name(filt)
+                                                  for filt in filters]),
+                          order=filters[0].mork_filter_order)
+        rows = stream_filters(db, filters, opts)
+        if monitor is not None:
+            monitor.stop()
+            _note_member_phases(monitor, filters)
+            if monitor.counts:
+                monitor.note(rows=rows)
+        return
+
+    for filt in filters:
+        if monitor is not None:
+            monitor.start('filter:%s' % filter_name(filt),
+                          order=filt.mork_filter_order)
+        filt.process(db, opts)
+        if monitor is not None:
+            monitor.stop()
+            _note_member_phases(monitor, [filt])
+            # Counting takes a pass over the database, so it's kept out of
+            # the phase's measurements.
+            if monitor.counts:
+                monitor.note(**database_counts(db))
@@ -0,0 +1,167 @@
+# Copyright 2010 Kevin Goodsell
+#
+# Column statistics gathered in a single pass over the rows, for filters that
+# need to know something about a whole column before converting any of it.
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import weakref
+
+_hex_matcher = re.compile(r'[a-f]', re.IGNORECASE)
+# str.isdigit() is also true for digits int() doesn't take (superscripts,
+# for example).
+_decimal_matcher = re.compile(r'[0-9]+\Z')
+
+class ColumnProfile(object):
+    '''
+    What a scan found in one (row namespace, column).
+    '''
+    def __init__(self):
+        # Number of cells.
+        self.count = 0
+        # True if any value has a letter that can only be a hex digit.
+        self.hex_letters = False
+        self.min_length = None
+        self.max_length = None
+        # Range of the values made up only of decimal digits.
+        self.min_decimal = None
+        self.max_decimal = None
+        # The first value that is decimal digits and isn't '0', which is a
+        # placeholder in many numeric columns.
+        self.sample = None
+        # The first value int() takes, for columns without a sample.
+        self.number = None
+
+        # Votes for the byte order of UTF-16 values, if they were asked for
+        # (see ColumnStats.scan): values with fewer distinct even bytes than
+        # odd bytes look big-endian, and the other way around.
+        self.byte_order = False
+        self.be_votes = 0
+        self.le_votes = 0
+
+    def _add(self, value, byte_order):
+        self.count += 1
+
+        length = len(value)
+        if self.min_length is None or length < self.min_length:
+            self.min_length = length
+        if self.max_length is None or length > self.max_length:
+            self.max_length = length
+
+        if _decimal_matcher.match(value):
+            number = int(value)
+            if self.min_decimal is None or number < self.min_decimal:
+                self.min_decimal = number
+            if self.max_decimal is None or number > self.max_decimal:
+                self.max_decimal = number
+            if self.sample is None and number != 0:
+                self.sample = value
+        elif not self.hex_letters and _hex_matcher.search(value):
+            self.hex_letters = True
+
+        if self.number is None:
+            try:
+                int(value)
+                self.number = value
+            except ValueError:
+                pass
+
+        if byte_order:
+            vote = byte_order_vote(value)
+            if vote == 'BE':
+                self.be_votes += 1
+            elif vote == 'LE':
+                self.le_votes += 1
+
+def byte_order_vote(value):
+    '''
+    Return 'BE' or 'LE' for the byte order a UTF-16 value looks like it
+    has, or None if it could be either.
+    '''
+    # Fewest unique Most Significant Bytes is a reasonable guess
+    be_msbs = set(value[::2]) # even indices
+    le_msbs = set(value[1::2]) # odd indices
+    if len(be_msbs) < len(le_msbs):
+        return 'BE'
+    elif len(be_msbs) > len(le_msbs):
+        return 'LE'
+    else:
+        return None
+
+class ColumnStats(object):
+    '''
+    Profiles (see ColumnProfile) for columns of a set of rows. Columns are
+    profiled when they're asked for, all the ones asked for at once sharing
+    a single pass over the rows. rows is a function returning the rows to
+    look at, as (row namespace, row id, MorkRow).
+    '''
+    def __init__(self, rows):
+        self._rows = rows
+        self._profiles = {} # {('row namespace', 'column') : ColumnProfile}
+
+    def scan(self, columns, byte_order=False):
+        '''
+        Profile each (row namespace, column) in columns that hasn't been
+        profiled yet, in one pass. If byte_order is true, the profiles
+        include UTF-16 byte order votes.
+        '''
+        wanted = {} # {'row namespace' : {'column' : ColumnProfile}}
+        for (row_ns, column) in columns:
+            profile = self._profiles.get((row_ns, column))
+            if profile is not None and (profile.byte_order or not byte_order):
+                continue
+
+            profile = self._profiles[row_ns, column] = ColumnProfile()
+            profile.byte_order = byte_order
+            wanted.setdefault(row_ns, {})[column] = profile
+
+        if not wanted:
+            return
+
+        for (row_ns, row_id, row) in self._rows():
+            row_wanted = wanted.get(row_ns)
+            if row_wanted is None:
+                continue
+
+            for (column, profile) in row_wanted.iteritems():
+                value = row.get(column)
+                if value is not None:
+                    profile._add(value, byte_order)
+
+    def profile(self, row_ns, column):
+        '''
+        Return the ColumnProfile for a column, scanning for it if needed.
+        '''
+        profile = self._profiles.get((row_ns, column))
+        if profile is None:
+            self.scan([(row_ns, column)])
+            profile = self._profiles[row_ns, column]
+
+        return profile
+
+# { MorkDatabase : ColumnStats }
+_database_stats = weakref.WeakKeyDictionary()
+
+def database_stats(db):
+    '''
+    Return the ColumnStats for all the rows of db. They're kept for as long
+    as db is.
+    '''
+    stats = _database_stats.get(db)
+    if stats is None:
+        stats = _database_stats[db] = ColumnStats(db.rows.items)
+
+    return stats
@@ -16,10 +16,12 @@
 
 import optparse
 import warnings
+import itertools
 import sys
 
-from filterbase import Filter
+from filterbase import RowFilter
 import converters
+import colstats
 
 _converters = {
     # General converters first.
@@ -215,10 +217,71 @@ def _convert_opt_callback(option, opt_str, value, parser):
         raise optparse.OptionValueError('unknown conversion: %r' % conversion)
     parser.values.convert[(row_ns, column)] = conversion
 
-class FieldConverter(Filter):
+def _column_conversions(opts):
+    '''
+    Yield (row namespace, column, conversion name) for every column that has
+    a conversion, with user-specified conversions taking precedence.
+    '''
+    for (row_ns, row_conversions) in _conversions.items():
+        for (column, conversion) in row_conversions.items():
+            if (row_ns, column) not in opts.convert:
+                yield (row_ns, column, conversion)
+
+    for ((row_ns, column), conversion) in opts.convert.items():
+        yield (row_ns, column, conversion)
+
+def _conversion_plan(opts):
+    '''
+    Work out the conversion for every column once for the run. Returns
+    {'row namespace' : {'column' : 'conversion name'}}, leaving out columns
+    whose conversion wouldn't change anything with these options (e.g. time
+    conversions with --no-time).
+    '''
+    plan = {}
+    for (row_ns, column, conversion) in _column_conversions(opts):
+        converter = _converters[conversion]
+        if isinstance(converter, converters.NullConverter):
+            continue
+        if converter.disabled_by and getattr(opts, converter.disabled_by):
+            continue
+
+        row_plan = plan.get(row_ns)
+        if row_plan is None:
+            row_plan = plan[row_ns] = {}
+        row_plan[column] = conversion
+
+    return plan
+
+class ColumnType(object):
+    '''
+    The type of the values in a column converted with --typed. kind is the
+    converter's native_kind. Cells may still hold text (for values with no
+    native form), which format() leaves alone.
+    '''
+    def __init__(self, conversion, opts):
+        self.conversion = conversion
+        self.kind = _converters[conversion].native_kind
+        self._opts = opts
+
+    def format(self, value):
+        '''
+        Return the text for a cell value, the same as the conversion would
+        have given without --typed.
+        '''
+        if isinstance(value, basestring):
+            return value
+
+        return _converters[self.conversion].format_native(self._opts, value)
+
+class FieldConverter(RowFilter):
     '''
     Filter to interpret Mork fields, making them more human-readable.
     '''
+    enable_option = 'no_convert'
+    enable_value = False
+    row_namespaces = frozenset(_conversions)
+    namespace_option = 'convert'
+
     def __init__(self, order):
         self.mork_filter_order = order
 
@@ -232,11 +295,16 @@ class FieldConverter(Filter):
         group.add_option('--time-format', metavar='FORMAT',
             help='use FORMAT as the strftime format for times/dates '
                  '(default: %c)')
+        group.add_option('--utc', action='store_true',
+            help='show times/dates in UTC instead of local time')
         group.add_option('--no-base', action='store_true',
             help="don't convert hexadecimal integers to decimal")
         group.add_option('--no-symbolic', action='store_true',
             help="don't do symbolic conversions (e.g. flags, booleans, and "
                  "number-to-string conversions)")
+        group.add_option('--typed', action='store_true',
+            help='keep converted values as integers, booleans and times '
+                 'until output, instead of text')
         group.add_option('--convert', action='callback',
             callback=_convert_opt_callback, type='str',
             metavar='ROW_NAMESPACE COLMUN CONVERSION', nargs=3,
@@ -253,35 +321,114 @@ class FieldConverter(Filter):
         parser.add_option_group(group)
         parser.set_defaults(time_format='%c', convert={})
 
-    def process(self, db, opts):
+    def start(self, db, opts):
         if opts.no_convert:
-            return
+            return None
+
+        plan = _conversion_plan(opts)
+        if not plan:
+            return None
 
         field = converters.FieldInfo(opts, db)
+        self._prepare(field, plan)
+        if opts.typed:
+            self._fill_schema(db, opts, plan)
 
-        for (row_namespace, row_id, row) in db.rows.items():
-            row_conversions = _conversions.get(row_namespace)
-            if row_conversions is None:
+        return (field, plan)
+
+    def _fill_schema(self, db, opts, plan):
+        # Output filters need to know how to turn the native values back
+        # into text.
+        for (row_ns, row_plan) in plan.items():
+            for (column, conversion) in row_plan.items():
+                if _converters[conversion].native_kind is not None:
+                    db.schema[(row_ns, column)] = ColumnType(conversion, opts)
+
+    def _prepare(self, field, plan):
+        # Converters that look at the whole database (to guess a number base,
+        # for example) do it now, for every column they are used for.
+        present = set([row_ns for (row_ns, row_id) in field.db.rows.iterkeys()])
+        prepare = []
+        for (row_ns, row_plan) in plan.items():
+            if row_ns not in present:
+                continue
+
+            for (column, conversion) in row_plan.items():
+                converter = _converters[conversion]
+                if hasattr(converter, 'prepare'):
+                    prepare.append((converter, row_ns, column))
+
+        if not prepare:
+            return
+
+        # They work from the column statistics, which can all be gathered in
+        # one pass.
+        colstats.database_stats(field.db).scan(
+            [(row_ns, column) for (converter, row_ns, column) in prepare])
+        for (converter, row_ns, column) in prepare:
+            converter.prepare(field, row_ns, column)
+
+    def detach(self, state):
+        (field, plan) = state
+        return (field.detached(), plan)
+
+    def finish(self, state):
+        (field, plan) = state
+        field.warn_unknown_flags()
+
+    def process_row(self, state, row_namespace, row_id, row):
+        self.process_rows(state, [(row_namespace, row_id, row)])
+
+    def process_rows(self, state, rows):
+        (field, plan) = state
+
+        # Gather the cells of each column so that it can be converted all at
+        # once.
+        columns = {} # {'row namespace' : {'column' : ([row], [value])}}
+        order = []   # [('row namespace', 'column')]
+        for (row_namespace, row_id, row) in rows:
+            row_plan = plan.get(row_namespace)
+            if row_plan is None:
                 continue
 
-            for (col, value) in row.items():
-                # Check user-specified conversions first.
-                conversion = opts.convert.get((row_namespace, col))
-                if conversion is None:
-                    conversion = row_conversions.get(col)
-                # Translate conversion (a string name) to a converter object
-                converter = _converters.get(conversion)
-                if converter:
-                    field.set_value(row_namespace, col, value)
-                    try:
-                        row[col] = converter.convert(field)
-                    except converters.ConversionError, e:
-                        warnings.warn(
-                            'unconvertible value, consider using '
-                            '--convert option\n'
-                            ' [value: %r; conversion: %s; message: %r;\n'
-                            '  row namespace: %s; column: %s]' %
-                                (value, conversion, str(e), row_namespace, col)
-                        )
+            row_columns = columns.get(row_namespace)
+            if row_columns is None:
+                row_columns = columns[row_namespace] = {}
+
+            for column in row_plan:
+                value = row.get(column)
+                if value is None:
+                    continue
+
+                cells = row_columns.get(column)
+                if cells is None:
+                    cells = row_columns[column] = ([], [])
+                    order.append((row_namespace, column))
+
+                cells[0].append(row)
+                cells[1].append(value)
+
+        for (row_namespace, column) in order:
+            conversion = plan[row_namespace][column]
+            (cell_rows, values) = columns[row_namespace][column]
+            field.set_value(row_namespace, column, None)
+            converter = _converters[conversion]
+            if field.opts.typed:
+                results = converter.native_many(field, values)
+            else:
+                results = converter.convert_many(field, values)
+            for (row, value, result) in itertools.izip(cell_rows, values,
+                                                       results):
+                if isinstance(result, converters.ConversionError):
+                    warnings.warn(
+                        'unconvertible value, consider using '
+                        '--convert option\n'
+                        ' [value: %r; conversion: %s; message: %r;\n'
+                        '  row namespace: %s; column: %s]' %
+                            (value, conversion, str(result), row_namespace,
+                             column)
+                    )
+                else:
+                    row[column] = result
 
 convert_fields = FieldConverter(4200)
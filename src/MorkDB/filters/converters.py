@@ -16,7 +16,10 @@
 
 import warnings
 import time
-import re
+
+from MorkDB.lrucache import LRUCache
+import colstats
+import timefmt
 
 class FieldInfo(object):
     '''Holds all the information a converter might need.'''
@@ -25,6 +28,13 @@ class FieldInfo(object):
         self.opts = opts
         self.db = db
 
+        # Number bases worked out for columns of this database.
+        self.bases = {} # {('row_ns', 'column') : int(base)}
+
+        # Flags without names seen by the flags converters, reported by
+        # warn_unknown_flags.
+        self.unknown_flags = {} # {('row_ns', 'column', flags) : cells}
+
         # items to be set in set_value
         self.row_ns = None
         self.column = None
@@ -35,6 +45,31 @@ class FieldInfo(object):
         self.column = column
         self.value = value
 
+    def detached(self):
+        '''
+        Return a copy without the database, for use in a worker process.
+        '''
+        field = FieldInfo(self.opts, None)
+        field.bases = dict(self.bases)
+        return field
+
+    def note_unknown_flags(self, flags):
+        key = (self.row_ns, self.column, flags)
+        self.unknown_flags[key] = self.unknown_flags.get(key, 0) + 1
+
+    def warn_unknown_flags(self):
+        '''
+        Give one warning for each unknown set of flags in each column, and
+        forget them.
+        '''
+        for ((row_ns, column, flags), cells) in sorted(
+                self.unknown_flags.items()):
+            warnings.warn('unknown flags\n'
+                          ' [value: 0x%x; row namespace: %s; column: %s; '
+                          'cells: %d]' % (flags, row_ns, column, cells))
+
+        self.unknown_flags.clear()
+
 class ConversionError(ValueError):
     pass
 
@@ -47,23 +82,135 @@ class FieldConverter(object):
     # generic or not generic, respectively.
     generic = False
 
+    # The option that turns the conversion off, leaving values unchanged.
+    # Converters don't check it themselves; the conversion filter leaves
+    # them out when it's set.
+    disabled_by = None
+
+    # Converters whose result depends only on the value and the options
+    # named in cache_options have their results cached by cached_convert.
+    # Converters that depend on anything else, or that are cheaper to run
+    # than a cache lookup, should set cacheable to False.
+    cacheable = True
+    cache_options = ()
+    cache_size = 5000
+
+    # The kind of native value to_native gives for --typed: 'integer',
+    # 'boolean', 'datetime' or 'flags' (a tuple of flag names). None means
+    # the converter has no native form, and to_native gives the same text
+    # as convert.
+    native_kind = None
+
+    def __init__(self):
+        self._cache = None
+        self._caching = self.cacheable
+        if self.cacheable:
+            self._cache = LRUCache('conversions (%s)' %
+                                   self.__class__.__name__, self.cache_size)
+
+        # The cache_options values from the last options seen.
+        self._opts = None
+        self._opts_key = None
+
     def convert(self, field):
         raise NotImplementedError();
 
+    def cached_convert(self, field):
+        '''
+        Same as convert, but reuses the result for values seen before.
+        '''
+        if not self._caching:
+            return self.convert(field)
+
+        if field.opts is not self._opts:
+            self._opts = field.opts
+            self._opts_key = tuple([getattr(field.opts, name)
+                                    for name in self.cache_options])
+
+        cache = self._cache
+        key = self._cache_key(field)
+        result = cache.get(key)
+        if result is None:
+            result = self.convert(field)
+            cache.put(key, result)
+
+            # Columns of unique values (like dates) just pay for the
+            # lookups, so give up if the cache isn't helping.
+            if cache.misses == self.cache_size and cache.hit_rate() < 0.25:
+                self._caching = False
+
+        return result
+
+    def _cache_key(self, field):
+        return (field.value, self._opts_key)
+
+    def convert_many(self, field, values):
+        '''
+        Convert a list of values from the column given by field.row_ns and
+        field.column. Returns a list holding the result for each value, or
+        the ConversionError raised for it. Each distinct value is only
+        converted once.
+        '''
+        return self._convert_each(field, values, self.cached_convert)
+
+    def to_native(self, field):
+        '''
+        Same as convert, but gives a native value (see native_kind) that
+        format_native turns into the text convert would give. Values that
+        have no native form are given as text.
+        '''
+        return self.cached_convert(field)
+
+    def native_many(self, field, values):
+        '''
+        Same as convert_many, but using to_native.
+        '''
+        return self._convert_each(field, values, self.to_native)
+
+    def format_native(self, opts, value):
+        '''
+        Return the text for a (non-text) value from to_native.
+        '''
+        return value
+
+    def _convert_each(self, field, values, convert):
+        results = {}
+        converted = []
+        for value in values:
+            result = results.get(value)
+            if result is None:
+                field.value = value
+                try:
+                    result = convert(field)
+                except ConversionError, e:
+                    result = e
+                results[value] = result
+
+            converted.append(result)
+
+        return converted
+
 class NullConverter(FieldConverter):
     description = 'No-op converter. Leaves the value unchanged.'
     generic = True
+    # Nothing to save.
+    cacheable = False
 
     def convert(self, field):
         return field.value
 
+    def convert_many(self, field, values):
+        return list(values)
+
+    native_many = convert_many
+
 class Int(FieldConverter):
     base = 10
+    disabled_by = 'no_base'
+    # Parsing and formatting an integer is about as fast as a lookup.
+    cacheable = False
 
     def convert(self, field):
-        if field.opts.no_base:
-            return field.value
-
         return unicode(self._to_int(field.value))
 
     def _to_int(self, value):
@@ -77,23 +224,81 @@ class IntHex(Int):
     generic = True
     base = 16
 
+    native_kind = 'integer'
+
+    def convert_many(self, field, values):
+        try:
+            return [unicode(int(value, 16)) for value in values]
+        except ValueError:
+            # Go through them one at a time to find the bad ones.
+            return Int.convert_many(self, field, values)
+
+    def to_native(self, field):
+        return self._to_int(field.value)
+
+    def native_many(self, field, values):
+        try:
+            return [int(value, 16) for value in values]
+        except ValueError:
+            return Int.native_many(self, field, values)
+
+    def format_native(self, opts, value):
+        return unicode(value)
+
 class SignedInt32(Int):
     description = 'Converts 32-bit hexadecimal integer values to (possibly '\
                   'negative) decimal values.'
     generic = True
     base = 16
 
+    native_kind = 'integer'
+
     def convert(self, field):
-        if field.opts.no_base:
-            return field.value
+        return unicode(self.to_native(field))
 
+    def to_native(self, field):
         ival = self._to_int(field.value)
         if ival > 0xffffffff:
             raise ConversionError('integer too large for 32 bits')
         if ival > 0x7fffffff:
             ival -= 0x100000000
 
-        return unicode(ival)
+        return ival
+
+    def convert_many(self, field, values):
+        ivals = self._signed_many(values)
+        if ivals is None:
+            return Int.convert_many(self, field, values)
+
+        return [unicode(ival) for ival in ivals]
+
+    def native_many(self, field, values):
+        ivals = self._signed_many(values)
+        if ivals is None:
+            return Int.native_many(self, field, values)
+
+        return ivals
+
+    def _signed_many(self, values):
+        # None if any of the values can't be converted.
+        try:
+            ivals = [int(value, 16) for value in values]
+        except ValueError:
+            return None
+
+        if not ivals or max(ivals) > 0xffffffff:
+            return None
+
+        result = []
+        for ival in ivals:
+            if ival > 0x7fffffff:
+                ival -= 0x100000000
+            result.append(ival)
+
+        return result
+
+    def format_native(self, opts, value):
+        return unicode(value)
 
 # From TB3.0.5:mailnews/imap/src/nsImapMailFolder.cpp, with constants in
 # mailnews/imap/src/nsImapCore.h
@@ -101,11 +306,9 @@ class HierDelim(Int):
     description = "Converter for the 'hierDelim' column from folder cache "\
                   "files (panacea.dat)."
     base = 16
+    disabled_by = 'no_symbolic'
 
     def convert(self, field):
-        if field.opts.no_symbolic:
-            return field.value
-
         ival = self._to_int(field.value)
         try:
             cval = chr(ival)
@@ -122,33 +325,104 @@ class Flags(Int):
     base = 16
     flag_values = None
     empty = ''
+    disabled_by = 'no_symbolic'
+    # Decoded values are kept in a cache of their own (see _lookup).
+    cacheable = False
+
+    def __init__(self):
+        Int.__init__(self)
+
+        # For each byte of the value, the flag names for every value of that
+        # byte.
+        self._byte_flags = []
+        for first in xrange(0, len(self.flag_values), 8):
+            names = self.flag_values[first:first + 8]
+            table = []
+            for byte in xrange(256):
+                table.append(tuple([name for (bit, name) in enumerate(names)
+                                    if name and byte & (1 << bit)]))
+            self._byte_flags.append(table)
+
+        self._known_flags = 0
+        for (bit, name) in enumerate(self.flag_values):
+            if name:
+                self._known_flags |= 1 << bit
+
+        # {'value' : (flag names, 'converted value', unknown flags)}
+        self._decoded = LRUCache('conversions (%s)' % self.__class__.__name__,
+                                 self.cache_size)
+
+    native_kind = 'flags'
 
     def convert(self, field):
-        if field.opts.no_symbolic:
-            return field.value
+        return self._convert_flags(field, 1)
 
-        ival = self._to_int(field.value)
-        flags = self._get_flags(ival, field)
+    def to_native(self, field):
+        return self._convert_flags(field, 0)
+
+    def convert_many(self, field, values):
+        return self._convert_many_flags(field, values, 1)
+
+    def native_many(self, field, values):
+        return self._convert_many_flags(field, values, 0)
+
+    def format_native(self, opts, value):
+        return self._text(value)
+
+    def _convert_flags(self, field, index):
+        item = self._lookup(field.value)
+        if item[2]:
+            field.note_unknown_flags(item[2])
+
+        return item[index]
+
+    def _convert_many_flags(self, field, values, index):
+        # Unknown flags are counted for every cell, not just for each
+        # distinct value.
+        decoded = {}
+        converted = []
+        for value in values:
+            item = decoded.get(value)
+            if item is None:
+                try:
+                    item = self._lookup(value)
+                except ConversionError, e:
+                    item = (e, e, 0)
+                decoded[value] = item
+
+            if item[2]:
+                field.note_unknown_flags(item[2])
+            converted.append(item[index])
+
+        return converted
+
+    def _lookup(self, value):
+        item = self._decoded.get(value)
+        if item is None:
+            (flags, unknown) = self._decode(self._to_int(value))
+            item = (flags, self._text(flags), unknown)
+            self._decoded.put(value, item)
+
+        return item
+
+    def _decode(self, ival):
+        '''
+        Return the flag names for ival, as a tuple, and the flags in it that
+        have no name.
+        '''
+        return (tuple(self._get_flags(ival)), ival & ~self._known_flags)
+
+    def _text(self, flags):
         if flags:
             return ' '.join(flags)
         else:
             return self.empty
 
-    def _get_flags(self, ival, field):
+    def _get_flags(self, ival):
         result = []
-        for (i, flag) in enumerate(self.flag_values):
-            if not flag:
-                continue
-
-            fval = 1 << i
-            if fval & ival:
-                result.append(flag)
-                ival -= fval
-
-        if ival:
-            warnings.warn('unknown flags\n'
-                          ' [value: 0x%x; row namespace: %s; column: %s]' %
-                          (ival, field.row_ns, field.column))
+        for table in self._byte_flags:
+            result.extend(table[ival & 0xff])
+            ival >>= 8
 
         return result
 
@@ -167,11 +441,7 @@ class MsgFlags(Flags):
     _priority_labels = ['notSet', 'none', 'lowest', 'low', 'normal', 'high',
                         'highest']
 
-    def convert(self, field):
-        if field.opts.no_symbolic:
-            return field.value
-
-        ival = self._to_int(field.value)
+    def _decode(self, ival):
         # Deal with non-flags:
         # Priorities = 0xE000
         priorities = ival & 0xE000
@@ -184,7 +454,7 @@ class MsgFlags(Flags):
         ival -= labels
         labels >>= 25
 
-        flags = self._get_flags(ival, field)
+        flags = self._get_flags(ival)
 
         if priorities:
             # Note that there's actually just one priority, but the name
@@ -193,6 +463,9 @@ class MsgFlags(Flags):
         if labels:
             flags.append('Labels:0x%X' % labels)
 
+        return (tuple(flags), ival & ~self._known_flags)
+
+    def _text(self, flags):
         return ' '.join(flags)
 
 # From TB3.0.5:mailnews/imap/src/nsImapMailFolder.cpp.
@@ -209,21 +482,20 @@ class ImapFlags(Flags):
                    'kImapMsgSupportForwardedFlag', 'kImapMsgSupportUserFlag']
     empty = 'kNoImapMsgFlag'
 
-    def convert(self, field):
-        if field.opts.no_symbolic:
-            return field.value
-
-        ival = self._to_int(field.value)
+    def _decode(self, ival):
         # Handle labels
         labels = ival & 0xE00
         ival -= labels
         labels >>= 9
 
-        flags = self._get_flags(ival, field)
+        flags = self._get_flags(ival)
 
         if labels:
             flags.append('Labels:0x%X' % labels)
 
+        return (tuple(flags), ival & ~self._known_flags)
+
+    def _text(self, flags):
         return ' '.join(flags)
 
 # TB3.0.5:mailnews/base/util/nsMsgDBFolder.cpp with flags defined in
@@ -275,6 +547,7 @@ class ViewFlags(Flags):
 
 class Enumeration(Int):
     base = 16
+    disabled_by = 'no_symbolic'
     values = None
     default = None
 
@@ -287,9 +560,6 @@ class Enumeration(Int):
             self._map = dict(enumerate(self.values))
 
     def convert(self, field):
-        if field.opts.no_symbolic:
-            return field.value
-
         if field.value == '':
             result = self.default
         else:
@@ -379,30 +649,65 @@ class BoolInt(Enumeration):
     generic = True
     values = ['false', 'true']
 
+    native_kind = 'boolean'
+    # Values that aren't 0 or 1 stay as they are.
+    _natives = {'false' : False, 'true' : True}
+
+    def to_native(self, field):
+        result = self.cached_convert(field)
+        return self._natives.get(result, result)
+
+    def format_native(self, opts, value):
+        return self.values[value]
+
 # This is for fields that signal something by their mere presence. The value
 # doesn't matter.
 class BoolAnyVal(FieldConverter):
     description = "Converts any value to 'true', for boolean values "\
                   "indicated by their presence or absence."
     generic = True
+    disabled_by = 'no_symbolic'
+    cacheable = False
+
+    native_kind = 'boolean'
 
     def convert(self, field):
-        if field.opts.no_symbolic:
-            return field.value
+        return 'true'
+
+    def to_native(self, field):
+        return True
 
+    def format_native(self, opts, value):
         return 'true'
 
 class Time(FieldConverter):
+    disabled_by = 'no_time'
+    cache_options = ('time_format', 'utc')
+
+    def __init__(self):
+        FieldConverter.__init__(self)
+
+        # The formatter for the last options seen.
+        self._formatter_opts = None
+        self._formatter = None
+
+    def _get_formatter(self, opts):
+        if opts is not self._formatter_opts:
+            self._formatter_opts = opts
+            self._formatter = timefmt.formatter(opts.time_format, opts.utc)
+
+        return self._formatter
+
     def _format(self, opts, t):
-        return time.strftime(opts.time_format, t)
+        try:
+            return self._get_formatter(opts).format_struct(t)
+        except ValueError, e:
+            raise ConversionError(str(e))
 
     def _to_time(self, field):
         raise NotImplementedError()
 
     def convert(self, field):
-        if field.opts.no_time:
-            return field.value
-
         t = self._to_time(field)
         return self._format(field.opts, t)
 
@@ -412,22 +717,54 @@ class Seconds(Time):
     base = 10
     divisor = 1
 
+    native_kind = 'datetime'
+
     def convert(self, field):
         # 0 is a common value, and obviously doesn't represent a valid time.
         if field.value == '0':
             return field.value
 
-        return Time.convert(self, field)
-
-    def _to_time(self, field):
+        seconds = self._to_number(field) // self.divisor
         try:
-            as_int = int(field.value, self.base)
-            seconds = as_int / self.divisor
-            return time.localtime(seconds)
-        # This should catch errors from int() and localtime()
+            return self._get_formatter(field.opts).format_seconds(seconds)
+        # This should catch errors from localtime() and strftime()
         except ValueError, e:
             raise ConversionError(str(e))
 
+    def to_native(self, field):
+        if field.value == '0':
+            return field.value
+
+        (seconds, fraction) = divmod(self._to_number(field), self.divisor)
+        formatter = self._get_formatter(field.opts)
+        try:
+            offset = formatter.utc_offset(seconds)
+            # datetime only handles whole-minute offsets, and strftime
+            # (which formats it again for output) only handles years from
+            # 1900 in Python 2.
+            if offset % 60 == 0:
+                dt = timefmt.to_datetime(seconds,
+                                         fraction * 1000000 // self.divisor,
+                                         offset)
+                if dt.year >= 1900:
+                    return dt
+        except (ValueError, OverflowError):
+            pass
+
+        # Anything else stays as text.
+        return self.cached_convert(field)
+
+    def format_native(self, opts, value):
+        return self._get_formatter(opts).format_datetime(value)
+
+    def _to_number(self, field):
+        '''
+        Return the value as an integer count of 1/divisor seconds.
+        '''
+        try:
+            return int(field.value, self.base)
+        except ValueError, e:
+            raise ConversionError(str(e))
 
 class FormattedTime(Time):
     # Define this in derived classes
@@ -435,10 +772,13 @@ class FormattedTime(Time):
 
     def _to_time(self, field):
         try:
-            return time.strptime(field.value, self.parse_format)
+            return self._parse(field.value)
         except ValueError, e:
             raise ConversionError(str(e))
 
+    def _parse(self, value):
+        return time.strptime(value, self.parse_format)
+
 class SecondsHex(Seconds):
     description = 'Converts hexadecimal seconds since epoch to formatted time.'
     base = 16
@@ -450,29 +790,46 @@ class Microseconds(Seconds):
 class SecondsGuessBase(Seconds):
     description = 'Convert number of seconds to formatted time, attempting '\
                   'to guess the number base.'
-
-    _known_bases = {} # {('row_ns', 'column') : int(base)}
-    _hex_matcher = re.compile(r'[a-f]+', re.IGNORECASE)
-
-    def _to_time(self, field):
-        base = self._known_bases.get((field.row_ns, field.column))
+    # The result depends on the base guessed for the column.
+    cacheable = False
+
+    def prepare(self, field, row_ns, column):
+        '''
+        Work out the number base for a column ahead of time, from the column
+        statistics for the database.
+        '''
+        profile = colstats.database_stats(field.db).profile(row_ns, column)
+        # Without a sample, the guess is made from the first value int()
+        # takes, as it would be when converting without preparing.
+        value = profile.sample
+        if value is None:
+            value = profile.number
+        if value is None and not profile.hex_letters:
+            # Nothing to guess from. Converting a value fails as it would
+            # without preparing.
+            return
+
+        field.set_value(row_ns, column, value)
+        field.bases[(row_ns, column)] = self._search_for_base(field)
+
+    def _to_number(self, field):
+        base = field.bases.get((field.row_ns, field.column))
         if base is None:
             base = self._search_for_base(field)
-            self._known_bases[(field.row_ns, field.column)] = base
+            field.bases[(field.row_ns, field.column)] = base
 
         try:
-            seconds = int(field.value, base)
-            return time.localtime(seconds)
-        # This should catch errors from int() and localtime()
+            return int(field.value, base)
         except ValueError, e:
             raise ConversionError(str(e))
 
     def _search_for_base(self, field):
-        for (row_ns, row_id, row) in field.db.rows.items():
-            val = row.get(field.column)
-            if val and self._hex_matcher.search(val):
-                base = 16
-                break
+        # A detached field (see FieldInfo.detached) has no database, but
+        # prepare() has already found the base of any column with hex
+        # letters.
+        if field.db is not None and colstats.database_stats(field.db).profile(
+                field.row_ns, field.column).hex_letters:
+            base = 16
         else:
             try:
                 as_dec = int(field.value)
@@ -500,13 +857,17 @@ class SecondsGuessBase(Seconds):
 # TB3.0.5:mailnews/db/msgdb/src/nsMsgDatabase.cpp.
 class LastPurgeTime(FormattedTime):
     description = "Converter for LastPurgeTime's formatted date/time."
-    parse_format = '%a %b %d %H:%M:%S %Y'
+    parse_format = timefmt.ctime_format
+
+    def _parse(self, value):
+        return timefmt.parse_ctime(value)
 
 # From TB3.0.5:mailnews/base/src/nsMsgDBView.cpp, using constants from
 # mailnews/base/public/nsIMsgDBView.idl. DecodeColumnSort describes how
 # to handle this.
 class SortColumns(FieldConverter):
     description = 'Converter for mail folder sort column.'
+    disabled_by = 'no_symbolic'
 
     _sort_order = {
         '0' : 'none',
@@ -537,9 +898,6 @@ class SortColumns(FieldConverter):
     }
 
     def convert(self, field):
-        if field.opts.no_symbolic:
-            return field.value
-
         sort_items = []
 
         # Normally, the value should be a sequence of byte-pairs, where the
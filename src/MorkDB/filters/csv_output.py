@@ -18,15 +18,22 @@
 
 import re
 import os
-import sys
+import csv
+import tempfile
+import cPickle
+from itertools import izip
 
 from filterbase import Filter
-from encoding import EncodingStream
+from encoding import open_output
+import parallel
 
 class CsvOutput(Filter):
     '''
     Filter that writes Mork databases in Comma-Separated Values format.
     '''
+    enable_option = 'out_format'
+    enable_value = 'csv'
+
     def __init__(self, order):
         self.mork_filter_order = order
 
@@ -36,6 +43,10 @@ class CsvOutput(Filter):
         parser.add_option('--single-file', action='store_true',
             help='for CSV output, use one file instead of a directory '
                  'containing a file for each table')
+        parser.add_option('--csv-spill-rows', type='int', metavar='N',
+            help='when streaming CSV output, move tables with more than N '
+                 'rows to a temporary file until their columns are known '
+                 '(default: %d, 0 to spill every table)' % _spill_rows)
 
         parser.set_defaults(out_format='csv')
 
@@ -43,25 +54,209 @@ class CsvOutput(Filter):
         if opts.out_format != 'csv':
             return
 
-        name = opts.outname or '-'
-        # Write a single file if it's asked for, or if the output is stdout.
-        single = opts.single_file or name == '-'
+        jobs = parallel.jobs(opts)
+        if jobs > 1 and not self._single(opts):
+            big = [key for (key, table) in db.tables.iteritems()
+                   if len(table) >= parallel.chunk_size]
+            # Workers only pay off for big tables, and only if there's more
+            # than one.
+            if len(big) > 1:
+                self._process_parallel(db, opts, jobs, set(big))
+                return
+
+        writer = self._writer(opts, db.schema)
+        for (namespace, oid, table) in db.tables.items():
+            writer.write_table(table, namespace, oid)
+            meta = db.meta_tables.get((namespace, oid))
+            if meta is not None:
+                writer.write_meta_table(meta, namespace, oid)
 
-        if single:
-            writer = _SingleFileWriter(opts, name)
-        else:
-            writer = _MultiFileWriter(opts, name)
+        writer.close()
 
+    def stream(self, db, opts, events):
+        if opts.out_format != 'csv':
+            return events
+
+        return self._output(opts, db.schema, events)
+
+    def _process_parallel(self, db, opts, jobs, big):
+        # Each table (and meta-table) has its own file, so the big tables can
+        # be written by separate workers while the rest are written here. The
+        # workers get the tables through parallel.shared(), since sending
+        # the rows to them costs about as much as writing them.
+        writer = self._writer(opts, db.schema)
+        tasks = []
         for (namespace, oid, table) in db.tables.items():
-            writer.write_table(table, namespace, oid)
+            if (namespace, oid) in big:
+                tasks.append((namespace, oid))
+            else:
+                writer.write_table(table, namespace, oid)
+
             meta = db.meta_tables.get((namespace, oid))
             if meta is not None:
                 writer.write_meta_table(meta, namespace, oid)
 
         writer.close()
+        shared = (opts, db.schema, writer.dirname, db.tables)
+        parallel.run_tasks(_write_table_file, tasks, jobs, shared=shared)
+
+    def _single(self, opts):
+        # Write a single file if it's asked for, or if the output is stdout.
+        return opts.single_file or (opts.outname or '-') == '-'
+
+    def _writer(self, opts, schema):
+        name = opts.outname or '-'
+        if self._single(opts):
+            writer = _SingleFileWriter(opts, name)
+        else:
+            writer = _MultiFileWriter(opts, name)
+
+        writer.schema = schema
+        return writer
+
+    def _output(self, opts, schema, events):
+        import MorkDB.morkdb as morkdb
+
+        writer = self._writer(opts, schema)
+        spill_rows = opts.csv_spill_rows
+        if spill_rows is None:
+            spill_rows = _spill_rows
+
+        # The header line needs the columns of every row in the table, so
+        # each table's rows are collected until the table ends. Past
+        # spill_rows rows, they're moved to a _SpilledTable so that memory
+        # use doesn't grow with the size of the table.
+        table = None
+        for event in events:
+            (namespace, oid, row_namespace, row_id, row) = event
+            if row_namespace is not None:
+                table.append(row_namespace, row_id, row)
+                if (len(table) > spill_rows and
+                    not isinstance(table, _SpilledTable)):
+                    spilled = _SpilledTable()
+                    for item in table:
+                        spilled.append(*item)
+                    table = spilled
+            else:
+                if table is not None:
+                    writer.write_table(table, *table_id)
+                    self._close_table(table)
+                    table = None
+
+                if row is None:
+                    table = morkdb.MorkTable()
+                    table_id = (namespace, oid)
+                else:
+                    writer.write_meta_table(row, namespace, oid)
+
+            yield event
+
+        if table is not None:
+            writer.write_table(table, *table_id)
+            self._close_table(table)
+
+        writer.close()
+
+    def _close_table(self, table):
+        if isinstance(table, _SpilledTable):
+            table.close()
 
 csv_filter = CsvOutput(10100)
 
+def _write_table_file(task):
+    (namespace, oid) = task
+    (opts, schema, dirname, tables) = parallel.shared()
+    writer = _MultiFileWriter(opts, dirname, create=False)
+    writer.schema = schema
+    writer.write_table(tables[namespace, oid], namespace, oid)
+    writer.close()
+
+# Default for --csv-spill-rows.
+_spill_rows = 10000
+
+class _SpilledTable(object):
+    '''
+    The rows of a table, kept in a temporary file while the set of columns
+    is collected. Each row is stored as its namespace, id, and a list of
+    (column number, value) cells, in batches, so only the column names are
+    held in memory. Iterating gives (namespace, id, row) with a dict for
+    the row, as for a MorkTable.
+    '''
+    _batch_size = 1000
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self._columns = {} # {'column' : number}
+        self._batch = []
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, namespace, rowid, row):
+        columns = self._columns
+        cells = []
+        for (column, value) in row.iteritems():
+            number = columns.get(column)
+            if number is None:
+                number = columns[column] = len(columns)
+            cells.append(number)
+            cells.append(value)
+
+        self._batch.append((namespace, rowid, cells))
+        self._length += 1
+        if len(self._batch) >= self._batch_size:
+            self._dump()
+
+    def _dump(self):
+        if self._batch:
+            cPickle.dump(self._batch, self._file, cPickle.HIGHEST_PROTOCOL)
+            self._batch = []
+
+    def column_names(self):
+        return self._columns.keys()
+
+    def __iter__(self):
+        self._dump()
+        names = [None] * len(self._columns)
+        for (column, number) in self._columns.iteritems():
+            names[number] = column
+
+        self._file.seek(0)
+        while True:
+            try:
+                batch = cPickle.load(self._file)
+            except EOFError:
+                break
+
+            for (namespace, rowid, cells) in batch:
+                row = dict(izip([names[number] for number in cells[::2]],
+                                cells[1::2]))
+                yield (namespace, rowid, row)
+
+        # Anything appended after this goes at the end. (2 is os.SEEK_END,
+        # which is new in Python 2.5.)
+        self._file.seek(0, 2)
+
+    def close(self):
+        self._file.close()
+
+# Rows are written with the csv module's writer where it gives the same
+# result as _TableWriter._format_csv_row: it doesn't quote leading or
+# trailing whitespace or lone carriage returns, and it can't handle NUL
+# characters, so rows with any of those are formatted by
+# _format_csv_row. To check a row (and to encode it, since the csv module
+# only handles byte strings) in one go, its values are joined with
+# _separator, which mustn't appear in the values themselves.
+_separator = u'\x01'
+_needs_formatting = re.compile(u'[\r\x00]|(?:^|\x01)[ \t]|[ \t](?:\x01|\Z)')
+
+class _Lines(list):
+    '''
+    Collects the lines from a csv writer.
+    '''
+    write = list.append
+
 class _TableWriter(object):
     '''
     _TableWriter is an abstraction to make it easy to write to either one file
@@ -70,6 +265,8 @@ class _TableWriter(object):
     '''
     def __init__(self, opts):
         self.opts = opts
+        # Types for columns holding typed values (see MorkDatabase.schema).
+        self.schema = {}
 
     def _new_table(self, namespace, oid):
         '''
@@ -84,17 +281,45 @@ class _TableWriter(object):
         raise NotImplementedError()
 
     def _write_rows(self, f, rows, headers):
+        lines = _Lines()
+        writer = csv.writer(lines, lineterminator='\n')
+        separators = len(headers) + 1
         for (row_namespace, rowid, row) in rows:
             # construct each output row by fetching the values corresponding to
             # each header (and using an empty string if there is none), then
             # prepending the row namespace and id.
             values = [row.get(header, '') for header in headers]
+            if self.schema:
+                values = self._format_typed(row_namespace, headers, values)
             values = [row_namespace, rowid] + values
-            print >> f, self._format_csv_row(values)
+
+            joined = _separator.join(values)
+            if (joined.count(_separator) == separators and
+                _needs_formatting.search(joined) is None):
+                writer.writerow(joined.encode('utf-8').split('\x01'))
+            else:
+                lines.append(self._format_csv_row(values).encode('utf-8'))
+                lines.append('\n')
+
+            if len(lines) >= 1000:
+                f.write(''.join(lines).decode('utf-8'))
+                del lines[:]
+
+        f.write(''.join(lines).decode('utf-8'))
+
+    def _format_typed(self, row_namespace, headers, values):
+        schema = self.schema
+        result = []
+        for (header, value) in zip(headers, values):
+            if not isinstance(value, basestring):
+                value = schema[(row_namespace, header)].format(value)
+            result.append(value)
+
+        return result
 
     def write_table(self, table, namespace, oid):
         import MorkDB.morkdb as morkdb
-        assert isinstance(table, morkdb.MorkTable)
+        assert isinstance(table, (morkdb.MorkTable, _SpilledTable))
         f = self._new_table(namespace, oid)
 
         # skip over empty tables:
@@ -148,10 +373,7 @@ class _TableWriter(object):
         '''
         Simple helper function to use EncodingStream.
         '''
-        if filename == '-':
-            return EncodingStream(self.opts.out_encoding, sys.stdout)
-        else:
-            return EncodingStream.open(self.opts.out_encoding, filename)
+        return open_output(self.opts.out_encoding, filename, self.opts)
 
     def close(self):
         pass
@@ -193,17 +415,19 @@ class _SingleFileWriter(_TableWriter):
         return self._new_table(namespace, oid, 'META-')
 
     def close(self):
-        if self.fp is not None and self.outname != '-':
+        # For standard output, this just flushes.
+        if self.fp is not None:
             self.fp.close()
             self.fp = None
 
 class _MultiFileWriter(_TableWriter):
-    def __init__(self, opts, dirname):
+    def __init__(self, opts, dirname, create=True):
         _TableWriter.__init__(self, opts)
 
         self.dirname = dirname
         self.current_file = None
-        os.mkdir(dirname)
+        if create:
+            os.mkdir(dirname)
 
     def _new_table(self, namespace, oid, postfix=''):
         self.close()
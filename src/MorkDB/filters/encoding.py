@@ -18,8 +18,18 @@ import warnings
 import codecs
 import re
 import optparse
+import itertools
+import weakref
+import sys
+import os
+import zlib
+import collections
 
 from filterbase import Filter
+import parallel
+import streaming
+import colstats
+from MorkDB.lrucache import LRUCache
 
 class FieldInfo(object):
     '''
@@ -35,6 +45,9 @@ class FieldInfo(object):
         self.column = None
         self.value = None
 
+        # The CharsetModel for the columns, or None to decode every value on
+        # its own.
+        self.charsets = None
         self._byte_order = None
 
     def set_value(self, row_namespace, column, value):
@@ -42,6 +55,18 @@ class FieldInfo(object):
         self.column = column
         self.value = value
 
+    def detached(self):
+        '''
+        Return a copy without the database, for use in a worker process. The
+        byte order has to be known already if it will be needed.
+        '''
+        field = FieldInfo(None, self.opts, self.table_namespace,
+                          self.table_id)
+        if self.charsets is not None:
+            field.charsets = self.charsets.detached()
+        field._byte_order = self._byte_order
+        return field
+
     def table(self):
         return self.db.tables[self.table_namespace, self.table_id]
 
@@ -77,49 +102,90 @@ class FieldInfo(object):
         return byte_order
 
     def _guess_byte_order(self):
-        table = self.db.tables.get((self.table_namespace, self.table_id))
-        be_count = 0
-        le_count = 0
-        # Check each row and column, testing for likely byte order
-        for (row_namespace, row_id, row) in table:
-            for (column, value) in row.items():
+        guesses = _byte_order_guesses.get(self.db)
+        if guesses is None:
+            guesses = _byte_order_guesses[self.db] = {}
+
+        key = (self.table_namespace, self.table_id)
+        guess = guesses.get(key)
+        if guess is None:
+            guess = guesses[key] = ByteOrderGuess(self.table_namespace,
+                                                  self.table_id)
+            guess.sample(self.db.tables.get(key, []))
+
+        return guess.byte_order
+
+# Byte order guessing samples the UTF-16 values of a table until one byte
+# order leads the other by _byte_order_margin votes, which is very unlikely
+# to happen by chance, or until _byte_order_samples values have been seen.
+_byte_order_margin = 10
+_byte_order_samples = 1000
+
+class ByteOrderGuess(object):
+    '''
+    A guess at the byte order of the UTF-16 values in a table.
+    '''
+    def __init__(self, table_namespace, table_id):
+        self.table_namespace = table_namespace
+        self.table_id = table_id
+        self.byte_order = 'LE'
+        # Number of UTF-16 values looked at, and how they voted.
+        self.samples = 0
+        self.be_votes = 0
+        self.le_votes = 0
+        # True once the guess has been included in a warning.
+        self.reported = False
+
+    def sample(self, rows):
+        for (row_namespace, row_id, row) in rows:
+            for (column, value) in row.iteritems():
                 if (row_namespace, column) not in _known_utf16:
-                    # Not a UTF-16 field
                     continue
 
-                warnings.warn('guessing byte order, consider using -b option')
+                self.samples += 1
+                vote = colstats.byte_order_vote(value)
+                if vote == 'BE':
+                    self.be_votes += 1
+                elif vote == 'LE':
+                    self.le_votes += 1
 
-                # Fewest unique Most Significant Bytes is a reasonable guess
-                be_msbs = set(value[::2]) # even indices
-                le_msbs = set(value[1::2]) # odd indices
-                if len(be_msbs) < len(le_msbs):
-                    be_count += 1
-                elif len(be_msbs) > len(le_msbs):
-                    le_count += 1
+            if (abs(self.be_votes - self.le_votes) >= _byte_order_margin or
+                self.samples >= _byte_order_samples):
+                break
 
-        if be_count > le_count:
-            return 'BE'
+        if self.be_votes > self.le_votes:
+            self.byte_order = 'BE'
         else:
-            return 'LE'
+            self.byte_order = 'LE'
 
-# Decoders:
+# { MorkDatabase : { ('table namespace', 'table id') : ByteOrderGuess } }
+_byte_order_guesses = weakref.WeakKeyDictionary()
 
-def _decode_from_opts(field):
+def _warn_byte_order_guesses(db):
     '''
-    Decoder that uses user-supplied encodings for specific fields.
+    Give one warning for the byte order guesses made for db that haven't
+    been reported yet (and that looked at any values).
     '''
-    if isinstance(field.opts.force_encoding, list):
-        # convert to dict:
-        kv = [((row_ns, col), enc) for (row_ns, col, enc)
-              in field.opts.force_encoding]
-        field.opts.force_encoding = dict(kv)
-
-    encoding = field.opts.force_encoding.get((field.row_namespace,
-                                              field.column))
-    if encoding is None:
-        return None
-
-    return field.value.decode(encoding)
+    guesses = [guess for guess in _byte_order_guesses.get(db, {}).values()
+               if guess.samples and not guess.reported]
+    if not guesses:
+        return
+
+    guesses.sort(key=lambda guess: (guess.table_namespace, guess.table_id))
+    details = []
+    for guess in guesses:
+        guess.reported = True
+        details.append('\n [table namespace: %s; table id: %s; byte order: '
+                       '%s; values sampled: %d (%d BE, %d LE)]' %
+                       (guess.table_namespace, guess.table_id,
+                        guess.byte_order, guess.samples, guess.be_votes,
+                        guess.le_votes))
+
+    warnings.warn('guessing byte order, consider using -b option%s' %
+                  ''.join(details))
+
+# Decoders for values in columns with no known encoding. Each returns None if
+# it can't decode the value.
 
 def _decode_utf8(field):
     '''
@@ -135,22 +201,6 @@ _known_utf16 = set([
     ('ns:formhistory:db:row:scope:formhistory:all', 'Name'),
     ('ns:formhistory:db:row:scope:formhistory:all', 'Value'),
 ])
-def _decode_known_utf16(field):
-    '''
-    Decoder for fields known to be UTF-16.
-    '''
-    if (field.row_namespace, field.column) not in _known_utf16:
-        return None
-
-    byte_order = field.byte_order()
-    if byte_order in ('BE', 'BBBB'):
-        codec = 'utf-16-be'
-    elif byte_order in ('LE', 'llll'):
-        codec = 'utf-16-le'
-    else:
-        assert False, 'Invalid byte order: %r' % byte_order
-
-    return field.value.decode(codec)
 
 _control_matcher = re.compile(ur'[\x80-\x9f]')
 def _decode_iso_8859(field):
@@ -178,6 +228,155 @@ def _decode_final(field):
     except UnicodeError:
         return None
 
+def _forced_encoding(field):
+    '''
+    Return the user-supplied encoding for the field's column, or None.
+    '''
+    if isinstance(field.opts.force_encoding, list):
+        # convert to dict:
+        kv = [((row_ns, col), enc) for (row_ns, col, enc)
+              in field.opts.force_encoding]
+        field.opts.force_encoding = dict(kv)
+
+    return field.opts.force_encoding.get((field.row_namespace, field.column))
+
+def _utf16_codec(byte_order):
+    if byte_order in ('BE', 'BBBB'):
+        return 'utf-16-be'
+    elif byte_order in ('LE', 'llll'):
+        return 'utf-16-le'
+    else:
+        assert False, 'Invalid byte order: %r' % byte_order
+
+# The automatic decoders, tried in order until one works.
+_auto_decoders = [
+    _decode_utf8,
+    _decode_iso_8859,
+    _decode_final,
+]
+
+def _auto_charset(opts, decoder):
+    '''
+    Return the name of the character set used by _auto_decoders[decoder].
+    '''
+    return ['utf-8', 'iso-8859-%s' % opts.iso_8859,
+            opts.fallback_charset][decoder]
+
+# Column character sets are chosen from up to _charset_samples non-ASCII
+# values per column, taken from the first _charset_sample_rows rows. A
+# decoder is chosen for a column if it's the first to work for at least
+# _charset_agreement of at least _charset_min_samples values.
+_charset_samples = 50
+_charset_sample_rows = 5000
+_charset_min_samples = 3
+_charset_agreement = 0.9
+
+class CharsetModel(object):
+    '''
+    The automatic decoder chosen for each (row namespace, column), worked out
+    from a sample of the values in a database. Values in a column almost
+    always share a character set, so they're decoded with the column's
+    decoder, and only the values it fails on (outliers) go through all of
+    the automatic decoders.
+    '''
+    def __init__(self):
+        # { ('row namespace', 'column') : index in _auto_decoders }
+        self.decoders = {}
+        # { ('row namespace', 'column') : [values won by each decoder] }
+        self.votes = {}
+        # { ('row namespace', 'column') : cells }
+        self.outliers = {}
+
+    def detached(self):
+        '''
+        Return a copy with no outliers counted, for use in a worker process.
+        '''
+        model = CharsetModel()
+        model.decoders = self.decoders
+        return model
+
+    def sample(self, db, opts):
+        field = FieldInfo(db, opts, None, None)
+        sampled = {} # { ('row namespace', 'column') : values sampled }
+        for ((row_namespace, row_id), row) in itertools.islice(
+                db.rows.iteritems(), _charset_sample_rows):
+            # Most rows are all ASCII, which is quicker to check in one go.
+            try:
+                ''.join(row.itervalues()).decode('ascii')
+                continue
+            except UnicodeError:
+                pass
+
+            for (column, value) in row.iteritems():
+                key = (row_namespace, column)
+                count = sampled.get(key, 0)
+                if (count >= _charset_samples or isinstance(value, unicode) or
+                    key in _known_utf16):
+                    continue
+
+                try:
+                    value.decode('ascii')
+                    # Any decoder will do for this value.
+                    continue
+                except UnicodeError:
+                    pass
+
+                field.set_value(row_namespace, column, value)
+                if count == 0 and _forced_encoding(field) is not None:
+                    sampled[key] = _charset_samples
+                    continue
+
+                sampled[key] = count + 1
+                votes = self.votes.get(key)
+                if votes is None:
+                    votes = self.votes[key] = [0] * len(_auto_decoders)
+                for (decoder, decode) in enumerate(_auto_decoders):
+                    if decode(field) is not None:
+                        votes[decoder] += 1
+                        break
+
+        for (key, votes) in self.votes.iteritems():
+            total = sum(votes)
+            best = max(votes)
+            if (total >= _charset_min_samples and
+                best >= total * _charset_agreement):
+                self.decoders[key] = votes.index(best)
+
+    def decoder(self, row_namespace, column):
+        '''
+        Return the index in _auto_decoders of the decoder for a column, or
+        None if the column has no decoder of its own.
+        '''
+        return self.decoders.get((row_namespace, column))
+
+    def note_outlier(self, row_namespace, column):
+        key = (row_namespace, column)
+        self.outliers[key] = self.outliers.get(key, 0) + 1
+
+    def merge_outliers(self, outliers):
+        for (key, count) in outliers.iteritems():
+            self.outliers[key] = self.outliers.get(key, 0) + count
+
+    def report(self, f, opts):
+        '''
+        Write the character set chosen for each sampled column, with the
+        number of outlier cells, to f.
+        '''
+        print >> f, 'column character sets:'
+        for key in sorted(self.votes):
+            (row_namespace, column) = key
+            votes = self.votes[key]
+            sampled = ', '.join(['%d %s' % (count, _auto_charset(opts, i))
+                                 for (i, count) in enumerate(votes) if count])
+            decoder = self.decoders.get(key)
+            if decoder is None:
+                chosen = 'per value'
+            else:
+                chosen = '%s, %d outliers' % (_auto_charset(opts, decoder),
+                                              self.outliers.get(key, 0))
+            print >> f, '  %s %s: %s (sampled: %s)' % (row_namespace, column,
+                                                        chosen, sampled)
+
 class DecodeCharacters(Filter):
     '''
     Filter to convert fields to unicode using user-specified options, known
@@ -185,6 +384,9 @@ class DecodeCharacters(Filter):
     '''
     def __init__(self, order):
         self.mork_filter_order = order
+        # Decoded values, keyed by (column policy, raw value). Senders,
+        # recipients and folder names repeat a lot in mail summary files.
+        self._cache = LRUCache('decoded values', 20000)
 
     def add_options(self, parser):
         decode_group = optparse.OptionGroup(parser, 'Field Decoding Options')
@@ -203,16 +405,92 @@ class DecodeCharacters(Filter):
         decode_group.add_option('--force-encoding',
             metavar='ROW_NAMESPACE COLUMN ENCODING', nargs=3, action='append',
             help='force the use of ENCODING for specified fields')
+        decode_group.add_option('--per-value-charset', action='store_true',
+            help="try the character sets for each value on its own, instead "
+                 "of choosing one for each column from a sample of its values")
+        decode_group.add_option('--charset-report', action='store_true',
+            help='print the character set chosen for each column, with the '
+                 'number of values it failed on, to stderr')
 
         parser.add_option_group(decode_group)
         parser.set_defaults(iso_8859='1', fallback_charset='windows-1252',
                             force_encoding=[])
 
     def process(self, db, opts):
+        jobs = parallel.jobs(opts)
+        if jobs > 1 and len(db.rows) > parallel.chunk_size:
+            self._process_parallel(db, opts, jobs)
+            return
+
+        charsets = self._charset_model(db, opts)
         for (table_namespace, table_id, table) in db.tables.items():
             field = FieldInfo(db, opts, table_namespace, table_id)
+            field.charsets = charsets
             self._filter_table(field, table)
 
+        self._finish(db, opts, charsets)
+
+    def _process_parallel(self, db, opts, jobs):
+        # Rows are decoded as part of the first table they appear in, as they
+        # are when working serially, and tables are split into chunks. The
+        # byte order for each table is worked out here, since the workers
+        # don't have the database.
+        charsets = self._charset_model(db, opts)
+        seen = set()
+        tasks = []
+        for (table_namespace, table_id, table) in db.tables.items():
+            field = FieldInfo(db, opts, table_namespace, table_id)
+            field.charsets = charsets
+            rows = []
+            for (row_namespace, row_id, row) in table:
+                if id(row) not in seen:
+                    seen.add(id(row))
+                    rows.append((row_namespace, row_id, row))
+
+            if self._needs_byte_order(field, rows):
+                field.byte_order()
+
+            field = field.detached()
+            for chunk in parallel.chunks(rows):
+                tasks.append((self, field, chunk))
+
+        def merge(task, result):
+            (filt, field, chunk) = task
+            (changes, outliers) = result
+            parallel.merge_rows([row for (row_ns, row_id, row) in chunk],
+                                changes)
+            if charsets is not None:
+                charsets.merge_outliers(outliers)
+
+        parallel.run_tasks(_decode_chunk, tasks, jobs, merge)
+
+        self._finish(db, opts, charsets)
+
+    def _charset_model(self, db, opts):
+        if opts.per_value_charset:
+            return None
+
+        charsets = CharsetModel()
+        charsets.sample(db, opts)
+        return charsets
+
+    def _finish(self, db, opts, charsets):
+        _warn_byte_order_guesses(db)
+        if opts.charset_report and charsets is not None:
+            charsets.report(sys.stderr, opts)
+
+    def _needs_byte_order(self, field, rows):
+        for (row_namespace, row_id, row) in rows:
+            for column in row:
+                if (row_namespace, column) not in _known_utf16:
+                    continue
+
+                field.set_value(row_namespace, column, None)
+                if _forced_encoding(field) is None:
+                    return True
+
+        return False
+
     def _iso_8895_parts(self):
         result = []
         for part in range(1, 17):
@@ -226,51 +504,229 @@ class DecodeCharacters(Filter):
         return result
 
     def _filter_table(self, field, table):
+        # { 'row namespace' : { 'column' : policy } }, worked out the first
+        # time each column is seen in this table.
+        policies = {}
         for (row_namespace, row_id, row) in table:
-            for (column, value) in row.items():
-                if isinstance(value, unicode):
-                    continue
+            self._filter_row(field, policies, row_namespace, row)
 
-                field.set_value(row_namespace, column, value)
-                row[column] = self._decode_field(field)
-
-    _decoders = [
-        _decode_from_opts,
-        _decode_known_utf16,
-        _decode_utf8,
-        _decode_iso_8859,
-        _decode_final,
-    ]
-
-    def _decode_field(self, field):
-        for decoder in self._decoders:
+    def _filter_row(self, field, policies, row_namespace, row):
+        row_policies = policies.get(row_namespace)
+        if row_policies is None:
+            row_policies = policies[row_namespace] = {}
+
+        for (column, value) in row.items():
+            if isinstance(value, unicode):
+                continue
+
+            field.set_value(row_namespace, column, value)
+            policy = row_policies.get(column)
+            if policy is None:
+                policy = row_policies[column] = self._column_policy(field)
+
+            row[column] = self._decode_field(field, policy)
+
+    def stream(self, db, opts, events):
+        # Rows are only decoded in the first table they appear in. Later
+        # filters may already have changed them by the time they come around
+        # again.
+        shared = streaming.shared_rows(db)
+        # The character sets are sampled before any rows are released.
+        charsets = self._charset_model(db, opts)
+        seen = set()
+        field = None
+        policies = None
+        for event in events:
+            (table_ns, table_id, row_ns, row_id, row) = event
+            if row_ns is not None:
+                key = (row_ns, row_id)
+                if key not in shared:
+                    self._filter_row(field, policies, row_ns, row)
+                elif key not in seen:
+                    seen.add(key)
+                    self._filter_row(field, policies, row_ns, row)
+            elif row is None:
+                # Start of a table. The rows are released as they go by, so
+                # the byte order has to be found now if it will be needed.
+                field = FieldInfo(db, opts, table_ns, table_id)
+                field.charsets = charsets
+                table = db.tables[table_ns, table_id]
+                if self._needs_byte_order(field, table):
+                    field.byte_order()
+                table = None
+                policies = {}
+
+            yield event
+
+        self._finish(db, opts, charsets)
+
+    def _column_policy(self, field):
+        '''
+        Decide how values in the field's column are decoded. The result is
+        ('codec', encoding) for columns with a forced or known encoding,
+        ('column', decoder, iso_8859, fallback_charset) for columns with an
+        automatic decoder chosen by the CharsetModel, or ('auto', iso_8859,
+        fallback_charset) for columns that go through all the automatic
+        decoders.
+        '''
+        encoding = _forced_encoding(field)
+        if encoding is not None:
+            return ('codec', encoding)
+
+        if (field.row_namespace, field.column) in _known_utf16:
+            return ('codec', _utf16_codec(field.byte_order()))
+
+        if field.charsets is not None:
+            decoder = field.charsets.decoder(field.row_namespace, field.column)
+            if decoder is not None:
+                return ('column', decoder, field.opts.iso_8859,
+                        field.opts.fallback_charset)
+
+        return ('auto', field.opts.iso_8859, field.opts.fallback_charset)
+
+    def _decode_field(self, field, policy):
+        value = field.value
+        if policy[0] != 'codec':
+            # Pure ASCII comes out the same from every automatic decoder, and
+            # is cheaper to decode than to look up.
+            try:
+                return value.decode('ascii')
+            except UnicodeError:
+                pass
+
+        key = (policy, value)
+        decoded_val = self._cache.get(key)
+        if decoded_val is None:
+            if policy[0] == 'codec':
+                decoded_val = value.decode(policy[1])
+            elif policy[0] == 'column':
+                # Cached with whether it was an outlier, so outliers are
+                # counted by cell.
+                decoded_val = self._decode_column(field, policy[1])
+            else:
+                decoded_val = self._decode_auto(field)
+
+            self._cache.put(key, decoded_val)
+
+        if policy[0] == 'column':
+            (decoded_val, outlier) = decoded_val
+            if outlier:
+                field.charsets.note_outlier(field.row_namespace, field.column)
+
+        return decoded_val
+
+    def _decode_column(self, field, decoder):
+        # A non-ASCII value that's valid UTF-8 is almost certainly UTF-8 (as
+        # _decode_auto would take it), even in a column of ISO-8859 values,
+        # which the ISO-8859 and fallback decoders would otherwise accept.
+        if decoder != 0:
+            decoded_val = _decode_utf8(field)
+            if decoded_val is not None:
+                return (decoded_val, True)
+
+        decoded_val = _auto_decoders[decoder](field)
+        if decoded_val is not None:
+            return (decoded_val, False)
+
+        return (self._decode_auto(field), True)
+
+    def _decode_auto(self, field):
+        for decoder in _auto_decoders:
             decoded_val = decoder(field)
             if decoded_val is not None:
                 return decoded_val
 
-        assert False, 'failed to decode %r' % value
+        assert False, 'failed to decode %r' % field.value
 
 new_decoding_filter = DecodeCharacters(2010)
 
+def _decode_chunk(task):
+    (filt, field, rows) = task
+    changes = parallel.filter_rows(
+        lambda rows: filt._filter_table(field, rows), rows)
+    outliers = {}
+    if field.charsets is not None:
+        outliers = field.charsets.outliers
+
+    return (changes, outliers)
+
 # Support for writing encoded streams while taking care of things like
 # Byte-Order Marks.
+#
+# Output filters write a few small pieces per cell, so EncodingStream
+# collects what's written and encodes it in chunks of about _buffer_size
+# characters, with an incremental encoder so that the chunks join up. Call
+# flush() or close() when done.
+_buffer_size = 64 * 1024
+
 class EncodingStream(object):
-    def __init__(self, output_encoding, stream):
+    def __init__(self, output_encoding, stream, owned=False):
+        '''
+        Write to stream (anything with write() and flush()) in
+        output_encoding. If owned is true, close() closes stream too.
+        '''
         (encoder, bom) = self._fix_encoding(output_encoding)
 
-        self.encoder = codecs.getencoder(encoder)
+        self.encoder = codecs.getincrementalencoder(encoder)()
         self.stream = stream
+        self._owned = owned
+        self._pending = []
+        self._pending_size = 0
 
         self.stream.write(bom)
 
     @classmethod
     def open(cls, output_encoding, filename):
         f = open(filename, 'w')
-        return cls(output_encoding, f)
+        return cls(output_encoding, f, owned=True)
+
+    @classmethod
+    def from_fd(cls, output_encoding, fd, owned=False):
+        '''
+        Write straight to the file descriptor fd, without another layer of
+        buffering. If owned is true, close() closes fd.
+        '''
+        return cls(output_encoding, _FdWriter(fd), owned)
 
     def write(self, s):
-        (s, consumed) = self.encoder(s)
-        self.stream.write(s)
+        self._pending.append(s)
+        self._pending_size += len(s)
+        if self._pending_size >= _buffer_size:
+            self._write_pending()
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+
+        text = ''.join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        self.stream.write(self.encoder.encode(text))
+
+    def flush(self):
+        self._write_pending()
+        self.stream.flush()
+
+    def close(self):
+        '''
+        Write out everything that's been written, and close the underlying
+        stream if it's owned (standard output isn't).
+        '''
+        if self.stream is None:
+            return
+
+        self._write_pending()
+        self.stream.write(self.encoder.encode(u'', True))
+        if self._owned:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+        self.stream = None
 
     def __getattr__(self, name):
         return getattr(self.stream, name)
@@ -301,3 +757,131 @@ class EncodingStream(object):
             replacement = normalized
 
         return (replacement, self._boms.get(replacement, ''))
+
+class _FdWriter(object):
+    '''
+    Minimal file object for a file descriptor, for EncodingStream.from_fd.
+    '''
+    def __init__(self, fd):
+        self.fd = fd
+
+    def write(self, data):
+        while data:
+            written = os.write(self.fd, data)
+            data = data[written:]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        os.close(self.fd)
+
+# Defaults for --gzip-level and --gzip-block-size.
+gzip_level = 6
+gzip_block_size = 1024 * 1024
+
+def _compress_block(task):
+    (level, data) = task
+    # A whole gzip member (wbits 31 adds the gzip header and trailer).
+    # zlib lets other threads run while it compresses.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+class GzipBlockWriter(object):
+    '''
+    File object that gzips what's written to it and writes the result to
+    stream. The data is cut into blocks of block_size bytes, which are
+    compressed by a pool of threads, each block as a gzip member of its
+    own. Concatenated members make a standard gzip file, which gzip and
+    Python's gzip module read as one.
+    '''
+    def __init__(self, stream, level=gzip_level, block_size=gzip_block_size,
+                 threads=None):
+        from multiprocessing.pool import ThreadPool
+
+        if threads is None:
+            threads = _cpu_count()
+
+        self.stream = stream
+        self.level = level
+        self.block_size = block_size
+        self._pool = ThreadPool(threads)
+        # Blocks being compressed, oldest first, as AsyncResults. There are
+        # at most _max_pending of them, to bound memory use.
+        self._compressing = collections.deque()
+        self._max_pending = 2 * threads
+        self._pending = []
+        self._pending_size = 0
+        self._submitted = False
+
+    def write(self, data):
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= self.block_size:
+            data = ''.join(self._pending)
+            self._pending = []
+            self._pending_size = 0
+            for start in xrange(0, len(data), self.block_size):
+                self._submit(data[start:start + self.block_size])
+
+    def _submit(self, block):
+        # The last (partial) block of a chunk goes in its own member, which
+        # is fine, if a bit smaller than it might have been.
+        while len(self._compressing) >= self._max_pending:
+            self.stream.write(self._compressing.popleft().get())
+
+        self._submitted = True
+        self._compressing.append(
+            self._pool.apply_async(_compress_block, ((self.level, block),)))
+
+    def flush(self):
+        # Even an empty file needs one (empty) member to be valid gzip.
+        if self._pending or not self._submitted:
+            data = ''.join(self._pending)
+            self._pending = []
+            self._pending_size = 0
+            self._submit(data)
+
+        while self._compressing:
+            self.stream.write(self._compressing.popleft().get())
+
+        self.stream.flush()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self.stream.close()
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+def open_output(output_encoding, name, opts=None):
+    '''
+    Return an EncodingStream for the output file name, or for standard
+    output if name is '-' or None. Closing it leaves standard output open.
+    Names ending in '.gz' are gzipped, using the --gzip-level and
+    --gzip-block-size settings from opts if it's given.
+    '''
+    if name is None or name == '-':
+        return EncodingStream(output_encoding, sys.stdout)
+    elif name.endswith('.gz'):
+        level = getattr(opts, 'gzip_level', None)
+        if level is None:
+            level = gzip_level
+        block_size = getattr(opts, 'gzip_block_size', None)
+        if block_size is None:
+            block_size = gzip_block_size
+        else:
+            block_size *= 1024
+
+        f = GzipBlockWriter(open(name, 'wb'), level, block_size)
+        return EncodingStream(output_encoding, f, owned=True)
+    else:
+        return EncodingStream.open(output_encoding, name)
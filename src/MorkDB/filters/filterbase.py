@@ -14,6 +14,8 @@
 # You should have received a copy of the GNU General Public License
 # along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
 
+import streaming
+
 class Filter(object):
     def add_options(self, parser):
         '''
@@ -27,6 +29,26 @@ class Filter(object):
         '''
         raise NotImplementedError()
 
+    # Filters may also provide stream(db, opts, events), which does the same
+    # work as process on a stream of rows (see MorkDB.filters.streaming).
+    # When every filter that is going to run can be streamed, they are run
+    # together as a pipeline and the database is released as it is written
+    # out, instead of each filter processing the whole database in turn.
+
+    # Hints used to plan which filters need to run (see
+    # MorkDB.filters.plan_filters). enable_option names the option that turns
+    # the filter on and enable_value is the value it must have; if
+    # enable_value is True or False, any true or false option value will do.
+    # An enable_option of None means the filter always runs.
+    enable_option = None
+    enable_value = True
+
+    # The row namespaces the filter can change, or None for any namespace.
+    # namespace_option can name an option holding a dict keyed by
+    # (row namespace, column) that adds to these namespaces.
+    row_namespaces = None
+    namespace_option = None
+
     # Order, to be overriden in derived classes or instances. Negative values
     # indicate something that shouldn't be used as a filter (such as base
     # classes or disabled filters).
@@ -43,3 +65,87 @@ class Filter(object):
     #         database-level translations can proceed.
     # 10000 - Point at which all translations are complete, and output can
     #         proceed.
+
+class RowFilter(Filter):
+    '''
+    Base class for filters that only need to look at one row at a time.
+    Consecutive row filters are run together in a single pass over the rows
+    of the database (see MorkDB.filters.run_filters), with each filter
+    applied to a row in turn. Row filters can also be streamed. Filters that
+    need whole-database context should derive from Filter and provide
+    process instead.
+    '''
+    def start(self, db, opts):
+        '''
+        Prepare for a pass over the rows of db. Returns the state that
+        process_row needs, or None if the filter has nothing to do.
+        '''
+        return opts
+
+    def process_row(self, state, row_namespace, row_id, row):
+        '''
+        Filter a single MorkRow in place.
+        '''
+        raise NotImplementedError()
+
+    def process_rows(self, state, rows):
+        '''
+        Filter a batch of rows, a list of (row namespace, row id, MorkRow),
+        in place. Row filters are given rows in batches, so filters that can
+        do the work for many rows at once (converting a whole column, for
+        example) should override this.
+        '''
+        for (row_namespace, row_id, row) in rows:
+            self.process_row(state, row_namespace, row_id, row)
+
+    def finish(self, state):
+        '''
+        Called when a pass over the rows is done, to report anything the
+        filter has been collecting (warnings, for example). Worker processes
+        call it after each chunk of rows.
+        '''
+        pass
+
+    def detach(self, state):
+        '''
+        Return a version of state that can be sent to a worker process or
+        used while the database is streamed: it must not refer to the
+        database, so anything process_row would look up in the database has
+        to be worked out here.
+        '''
+        return state
+
+    def stream(self, db, opts, events):
+        '''
+        Streaming version of process (see MorkDB.filters.streaming).
+        '''
+        state = self.start(db, opts)
+        if state is None:
+            return events
+
+        return self._stream_rows(self.detach(state),
+                                 streaming.shared_rows(db), events)
+
+    def _stream_rows(self, state, shared, events):
+        seen = set()
+        for event in events:
+            for (row_namespace, row_id, row) in streaming.event_rows(event):
+                key = (row_namespace, row_id)
+                if key in shared:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+
+                self.process_row(state, row_namespace, row_id, row)
+
+            yield event
+
+        self.finish(state)
+
+    def process(self, db, opts):
+        state = self.start(db, opts)
+        if state is None:
+            return
+
+        self.process_rows(state, db.rows.items())
+        self.finish(state)
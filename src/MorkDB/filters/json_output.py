@@ -0,0 +1,116 @@
+# Copyright 2010 Kevin Goodsell
+#
+# Output filter for writing Mork databases as JSON Lines: one JSON object
+# per line for each row and meta-table.
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import datetime
+
+from filterbase import Filter
+from encoding import open_output
+import streaming
+
+# Each line is one of:
+#
+#   {"type":"row","table_namespace":...,"table_id":...,"namespace":...,
+#    "id":...,"cells":{column:value,...}}
+#   {"type":"metatable","table_namespace":...,"table_id":...,
+#    "cells":{column:value,...},"rows":[{"namespace":...,"id":...,
+#    "cells":{...}},...]}
+#
+# Cell values are strings, except with --typed, where converted values are
+# numbers, booleans, lists of flag names and ISO 8601 times.
+
+class JsonLinesOutput(Filter):
+    '''
+    Filter that writes Mork databases as JSON Lines, one object per row.
+    '''
+    enable_option = 'out_format'
+    enable_value = 'jsonl'
+
+    def __init__(self, order):
+        self.mork_filter_order = order
+
+    def add_options(self, parser):
+        parser.add_option('--jsonl', dest='out_format', action='store_const',
+            const='jsonl', help='output JSON Lines (one JSON object for each '
+                                'row and meta-table)')
+
+        parser.set_defaults(out_format='jsonl')
+
+    def process(self, db, opts):
+        if opts.out_format != 'jsonl':
+            return
+
+        streaming.drain(self.stream(db, opts, streaming.events(db)))
+
+    def stream(self, db, opts, events):
+        if opts.out_format != 'jsonl':
+            return events
+
+        f = open_output(opts.out_encoding, opts.outname, opts)
+        return self._output(f, events)
+
+    def _output(self, f, events):
+        # The output is ASCII (anything else is escaped), so it's valid
+        # whatever the output encoding.
+        encode = json.JSONEncoder(separators=(',', ':'),
+                                  default=_json_default).encode
+        lines = []
+        # The start of each row's line, which is the same for the whole
+        # table.
+        prefix = None
+        for event in events:
+            (namespace, oid, row_namespace, row_id, row) = event
+            if row_namespace is not None:
+                lines.append('%s%s,"id":%s,"cells":%s}\n' % (
+                    prefix, encode(row_namespace), encode(row_id),
+                    encode(row)))
+            elif row is not None:
+                lines.append(self._meta_table_line(encode, namespace, oid,
+                                                   row))
+            else:
+                prefix = '{"type":"row","table_namespace":%s,"table_id":%s,' \
+                         '"namespace":' % (encode(namespace), encode(oid))
+
+            if len(lines) >= self._chunk_lines:
+                f.write(''.join(lines))
+                lines = []
+
+            yield event
+
+        f.write(''.join(lines))
+        f.close()
+
+    # Lines to collect before writing them out.
+    _chunk_lines = 1000
+
+    def _meta_table_line(self, encode, namespace, oid, meta):
+        rows = [{'namespace': row_namespace, 'id': row_id, 'cells': row}
+                for (row_namespace, row_id, row) in meta.rows]
+        return '{"type":"metatable","table_namespace":%s,"table_id":%s,' \
+               '"cells":%s,"rows":%s}\n' % (encode(namespace), encode(oid),
+                                             encode(meta.cells), encode(rows))
+
+def _json_default(value):
+    # Typed values that JSON has no type for.
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+jsonl_filter = JsonLinesOutput(10000)
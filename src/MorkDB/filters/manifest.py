@@ -0,0 +1,310 @@
+# Copyright 2010 Kevin Goodsell
+#
+# The filter manifest: a record of the filters each module in this package
+# provides, with their order, planning hints and options, so that options can
+# be parsed and filters planned without importing the filter modules.
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import marshal
+import optparse
+
+try:
+    from hashlib import md5
+except ImportError:
+    # Python 2.4
+    from md5 import md5
+
+# The manifest is kept in a file in the user's cache directory (the package
+# directory may not be writable), and is rebuilt whenever a module is added,
+# removed or changed. Filters depend on other modules for their base classes
+# and options, so a change to any module rebuilds the whole manifest. It's
+# stored with marshal, and is made of dicts, lists, tuples, strings, numbers
+# and None:
+#
+# {
+#   'signature' : package signature (see package_signature),
+#   'modules' : { 'module name' : [ filter record, ... ] },
+#   'import' : [ 'module name', ... ],
+# }
+#
+# Modules that provide no filters (helpers such as filterbase) are recorded
+# with an empty filter list so they are never imported just to look for
+# filters. Modules that couldn't be imported or described are listed under
+# 'import' and imported every time.
+
+def _cache_directory():
+    if sys.platform == 'win32':
+        cache = os.environ.get('LOCALAPPDATA') or os.environ.get('APPDATA')
+    else:
+        cache = os.environ.get('XDG_CACHE_HOME')
+    if not cache:
+        cache = os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(cache, 'mork-converter')
+
+def manifest_path(directory):
+    '''
+    Return the name of the manifest file for the filter modules in
+    directory. The name depends on the directory, so separate copies of the
+    package don't share a manifest, and on the Python version, since the
+    marshal format can change between versions.
+    '''
+    key = md5(os.path.abspath(directory)).hexdigest()[:16]
+    return os.path.join(_cache_directory(), 'filters-%s-py%d%d.manifest' %
+                        ((key,) + tuple(sys.version_info[:2])))
+
+def read_manifest(directory):
+    '''
+    Return the manifest for directory, or an empty one if there isn't a
+    usable manifest.
+    '''
+    try:
+        f = open(manifest_path(directory), 'rb')
+        try:
+            manifest = marshal.load(f)
+        finally:
+            f.close()
+    except (IOError, EOFError, ValueError, TypeError):
+        return {}
+
+    if not isinstance(manifest, dict):
+        return {}
+
+    return manifest
+
+def write_manifest(directory, manifest):
+    filename = manifest_path(directory)
+    temp_name = '%s.%d' % (filename, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+
+        f = open(temp_name, 'wb')
+        try:
+            marshal.dump(manifest, f)
+        finally:
+            f.close()
+
+        try:
+            os.rename(temp_name, filename)
+        except OSError:
+            # Windows won't rename over an existing file.
+            os.remove(filename)
+            os.rename(temp_name, filename)
+    except (IOError, OSError):
+        # The cache directory may not be writable. Filters will just be
+        # imported the old way.
+        try:
+            os.remove(temp_name)
+        except OSError:
+            pass
+
+def package_signature(directory, modules):
+    '''
+    Return something that changes when any of the modules (a dict mapping
+    module names to directory entries, e.g., ['encoding.py', 'encoding.pyc'])
+    changes.
+    '''
+    signature = []
+    for (name, entries) in sorted(modules.items()):
+        # Compiled files change without the module changing, so only use
+        # them if there's no source.
+        sources = [entry for entry in entries
+                   if entry.endswith('.py') or '.' not in entry]
+        if not sources:
+            sources = entries
+
+        for entry in sorted(sources):
+            st = os.stat(os.path.join(directory, entry))
+            signature.append((entry, int(st.st_mtime), st.st_size))
+
+    return tuple(signature)
+
+def describe_filters(filters):
+    '''
+    Return the manifest records for filters, a list of (attribute name,
+    filter) pairs from a module, or None if the filters can't be described.
+    '''
+    try:
+        records = [_describe_filter(filt, attribute)
+                   for (attribute, filt) in filters]
+    except _NotDescribable:
+        return None
+
+    # Anything that doesn't survive the trip through the file would give
+    # the wrong options.
+    try:
+        if marshal.loads(marshal.dumps(records)) != records:
+            return None
+    except ValueError:
+        return None
+
+    return records
+
+class _NotDescribable(Exception):
+    pass
+
+def _describe_filter(filt, attribute):
+    from MorkDB.filters import filter_name
+
+    row_namespaces = filt.row_namespaces
+    if row_namespaces is not None:
+        row_namespaces = sorted(row_namespaces)
+
+    return {
+        'attribute': attribute,
+        'name': filter_name(filt),
+        'doc': filt.__doc__,
+        'order': filt.mork_filter_order,
+        'enable_option': filt.enable_option,
+        'enable_value': filt.enable_value,
+        'row_namespaces': row_namespaces,
+        'namespace_option': filt.namespace_option,
+        'options': _describe_options(filt),
+    }
+
+def _describe_options(filt):
+    # Let the filter add its options to a parser of its own, then read them
+    # back.
+    parser = optparse.OptionParser(add_help_option=False)
+    filt.add_options(parser)
+
+    options = [('option', _describe_option(option))
+               for option in parser.option_list]
+    for group in parser.option_groups:
+        options.append(('group', group.title, group.description,
+                        [_describe_option(option)
+                         for option in group.option_list]))
+
+    # Defaults from set_defaults() as well as the options themselves.
+    defaults = dict([(dest, value) for (dest, value)
+                     in parser.defaults.items() if value is not None])
+    if defaults:
+        options.append(('defaults', defaults))
+
+    return options
+
+def _describe_option(option):
+    kwargs = {}
+    for attr in option.ATTRS:
+        value = getattr(option, attr)
+        if value is None or value is optparse.NO_DEFAULT:
+            continue
+        if attr == 'callback':
+            value = _callback_path(value)
+        kwargs[attr] = value
+
+    return (option._short_opts + option._long_opts, kwargs)
+
+def _callback_path(callback):
+    module_name = getattr(callback, '__module__', None)
+    name = getattr(callback, '__name__', None)
+    module = sys.modules.get(module_name)
+    if module is None or getattr(module, name, None) is not callback:
+        raise _NotDescribable()
+
+    return '%s:%s' % (module_name, name)
+
+def _import_object(path):
+    (module_name, name) = path.split(':')
+    __import__(module_name)
+    return getattr(sys.modules[module_name], name)
+
+class _LazyCallback(object):
+    '''
+    Option callback that imports the real callback when it's first used.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._callback = None
+
+    def __call__(self, *args, **kwargs):
+        if self._callback is None:
+            self._callback = _import_object(self.path)
+
+        return self._callback(*args, **kwargs)
+
+def _add_option(container, option):
+    (option_strings, kwargs) = option
+    kwargs = dict(kwargs)
+    if 'callback' in kwargs:
+        kwargs['callback'] = _LazyCallback(kwargs['callback'])
+
+    container.add_option(*option_strings, **kwargs)
+
+def add_options(parser, options):
+    '''
+    Add options recorded in the manifest to parser.
+    '''
+    for item in options:
+        if item[0] == 'option':
+            _add_option(parser, item[1])
+        elif item[0] == 'defaults':
+            parser.set_defaults(**item[1])
+        else:
+            (kind, title, description, group_options) = item
+            group = optparse.OptionGroup(parser, title, description)
+            for option in group_options:
+                _add_option(group, option)
+            parser.add_option_group(group)
+
+class LazyFilter(object):
+    '''
+    Stands in for a filter listed in the manifest. Everything needed to add
+    options and plan the filter is available without importing the filter's
+    module, which is imported when the filter is loaded or run.
+    '''
+    def __init__(self, module_name, record):
+        self.module_name = module_name
+        self.attribute = record['attribute']
+        self.__name__ = record['name']
+        self.__doc__ = record['doc']
+        self.mork_filter_order = record['order']
+        self.enable_option = record['enable_option']
+        self.enable_value = record['enable_value']
+        self.row_namespaces = record['row_namespaces']
+        if self.row_namespaces is not None:
+            self.row_namespaces = frozenset(self.row_namespaces)
+        self.namespace_option = record['namespace_option']
+        self._options = record['options']
+        self._filter = None
+
+    def load(self):
+        '''
+        Import the filter's module and return the filter itself.
+        '''
+        if self._filter is None:
+            self._filter = _import_object('%s:%s' % (self.module_name,
+                                                     self.attribute))
+
+        return self._filter
+
+    def add_options(self, parser):
+        add_options(parser, self._options)
+
+    def process(self, db, opts):
+        self.load().process(db, opts)
+
+def load_filter(filt):
+    '''
+    Return the real filter for filt, which may be a LazyFilter.
+    '''
+    if isinstance(filt, LazyFilter):
+        return filt.load()
+
+    return filt
@@ -18,34 +18,50 @@ import re
 import warnings
 import quopri
 
-from filterbase import Filter
+from filterbase import RowFilter
+from MorkDB.lrucache import LRUCache
 
-class DecodeMimeHeaders(Filter):
+class DecodeMimeHeaders(RowFilter):
     '''Filter to decode RFC 2047 MIME headers.'''
+    enable_option = 'mime_headers'
+
     def __init__(self, order):
         self.mork_filter_order = order
+        # Subjects and senders repeat a lot (mailing lists, replies), so
+        # decoded headers are kept, and so are decoded encoded-words, which
+        # are shared between headers (like a list name in subjects).
+        self._headers = LRUCache('MIME headers', 10000)
+        self._words = LRUCache('MIME encoded-words', 10000)
+        # Encoded-words that couldn't be decoded and have been warned about.
+        self._failed = set()
 
     def add_options(self, parser):
         parser.add_option('--mime-headers', action='store_true',
             help='decode MIME email headers '
                  '(e.g.: =?iso-8859-1?Q?=A1Hola,_se=F1or!?=)')
 
-    def process(self, db, opts):
+    def start(self, db, opts):
         if not opts.mime_headers:
+            return None
+
+        return opts
+
+    def process_row(self, state, row_namespace, rowid, row):
+        headers = self._header_fields.get(row_namespace)
+        if headers is None:
+            # This kind of row has no headers to decode.
             return
 
-        for (row_namespace, rowid, row) in db.rows.items():
-            headers = self._header_fields.get(row_namespace)
-            if headers is None:
-                # This kind of row has no headers to decode.
+        for (column, value) in row.items():
+            if column not in headers:
+                # This is not a decodable header.
                 continue
 
-            for (column, value) in row.items():
-                if column not in headers:
-                    # This is not a decodable header.
-                    continue
+            if '=?' not in value:
+                # Nothing encoded, which is the usual case.
+                continue
 
-                row[column] = self._decode_header(value)
+            row[column] = self._decode_header(value)
 
     # This must contain all field that need to be converted.
     _header_fields = {
@@ -54,6 +70,7 @@ class DecodeMimeHeaders(Filter):
                                               'subject', 'ccList', 'replyTo']),
         'ns:msg:db:row:scope:threads:all' : set(['threadSubject']),
     }
+    row_namespaces = frozenset(_header_fields)
 
     def _decode_string(self, charset, encoding, encoded):
         if encoding == 'q':
@@ -80,20 +97,35 @@ class DecodeMimeHeaders(Filter):
     ''', re.VERBOSE | re.IGNORECASE | re.MULTILINE)
 
     def _replacer(self, m):
+        val = m.group()
+        decoded = self._words.get(val)
+        if decoded is not None:
+            return decoded
+
         charset = m.group('charset')
         encoding = m.group('encoding')
         encoded = m.group('encoded')
 
         try:
-            return self._decode_string(charset, encoding.lower(), encoded)
+            decoded = self._decode_string(charset, encoding.lower(), encoded)
         # There doesn't seem to be a more specific exception that can be used
         # here.
         except Exception, e:
-            val = m.group()
-            warnings.warn('mime_headers decoding failed for %r (%s)' % (val, e))
-            return val
+            if val not in self._failed:
+                self._failed.add(val)
+                warnings.warn('mime_headers decoding failed for %r (%s)' %
+                              (val, e))
+            decoded = val
+
+        self._words.put(val, decoded)
+        return decoded
 
     def _decode_header(self, value):
-        return self._encoded_matcher.sub(self._replacer, value)
+        decoded = self._headers.get(value)
+        if decoded is None:
+            decoded = self._encoded_matcher.sub(self._replacer, value)
+            self._headers.put(value, decoded)
+
+        return decoded
 
 mime_headers_filter = DecodeMimeHeaders(4600)
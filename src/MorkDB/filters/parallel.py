@@ -0,0 +1,155 @@
+# Copyright 2010 Kevin Goodsell
+#
+# Helpers for running filter work in a pool of worker processes.
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+
+# Work is sent to the workers in chunks of rows. Each chunk carries
+# everything the worker needs (options, byte orders, number bases, ...), so
+# the workers never see the database itself. The filtered rows are sent back
+# and merged into the original row objects, which are shared between the row
+# store and the tables.
+
+# Rows per chunk. Smaller chunks balance better, larger ones have less
+# overhead.
+chunk_size = 2000
+
+def jobs(opts):
+    '''
+    Return the number of worker processes requested in opts.
+    '''
+    return max(getattr(opts, 'jobs', None) or 1, 1)
+
+def chunks(items, size=None):
+    '''
+    Split the list items into lists of at most size items.
+    '''
+    if size is None:
+        size = chunk_size
+
+    return [items[i:i+size] for i in xrange(0, len(items), size)]
+
+# Data given to run_tasks for every task (see shared()).
+_shared = None
+
+def _set_shared(shared):
+    global _shared
+    _shared = shared
+
+def shared():
+    '''
+    Return the shared data passed to run_tasks, in a worker process.
+    '''
+    return _shared
+
+def run_tasks(function, tasks, jobs, handle=None, shared=None):
+    '''
+    Call function (which must be a module-level function, so it can be sent
+    to another process) for each task using jobs worker processes, and call
+    handle(task, result) for each result in task order, as they come in.
+    shared is made available to the workers through shared(). It's handed
+    over once per worker (where processes are forked, without copying it at
+    all), so it's the place for large data that many tasks need.
+    '''
+    import multiprocessing
+
+    pool = multiprocessing.Pool(jobs, _set_shared, (shared,))
+    try:
+        results = pool.imap(function, tasks)
+        for (task, result) in itertools.izip(tasks, results):
+            if handle is not None:
+                handle(task, result)
+    finally:
+        pool.close()
+        pool.join()
+
+def row_changes(before, after):
+    '''
+    Describe how a row changed, as (changed cells, removed columns), so that
+    only the changes have to be sent back from a worker.
+    '''
+    changed = {}
+    for (column, value) in after.iteritems():
+        old = before.get(column)
+        if old is None or old is not value:
+            changed[column] = value
+
+    removed = [column for column in before if column not in after]
+    return (changed, removed)
+
+def merge_rows(originals, changes):
+    '''
+    Apply the row_changes results in changes to the rows in originals.
+    Cells are updated in place, which keeps the order of the columns.
+    '''
+    for (original, (changed, removed)) in zip(originals, changes):
+        for column in removed:
+            del original[column]
+        # Not update(), which may resize the dict and reorder it.
+        for (column, value) in changed.iteritems():
+            original[column] = value
+
+def filter_rows(function, rows):
+    '''
+    Call function on rows (a list of (namespace, id, row)) in a worker, and
+    return the changes made to each row.
+    '''
+    before = [dict(row) for (row_namespace, row_id, row) in rows]
+    function(rows)
+    return [row_changes(old, row)
+            for (old, (row_namespace, row_id, row)) in zip(before, rows)]
+
+def _process_row_chunk(task):
+    (handlers, rows) = task
+    def process(rows):
+        for (filt, state) in handlers:
+            filt.process_rows(state, rows)
+            filt.finish(state)
+
+    return filter_rows(process, rows)
+
+def process_rows(db, active, jobs):
+    '''
+    Parallel version of the row traversal done for row filters. active is a
+    list of (filter, namespaces, state) in filter order, where namespaces is
+    the set of row namespaces the filter handles (or None for all) and state
+    has already been detached from the database (see RowFilter.detach).
+    '''
+    # Group the rows by namespace, so each chunk has a single list of
+    # handlers.
+    by_namespace = {} # { 'row namespace' : [(namespace, id, row)] }
+    for (row_namespace, row_id, row) in db.rows.items():
+        rows = by_namespace.get(row_namespace)
+        if rows is None:
+            rows = by_namespace[row_namespace] = []
+        rows.append((row_namespace, row_id, row))
+
+    tasks = []
+    for (row_namespace, rows) in by_namespace.items():
+        handlers = [(filt, state) for (filt, namespaces, state) in active
+                    if namespaces is None or row_namespace in namespaces]
+        if not handlers:
+            continue
+
+        for chunk in chunks(rows):
+            tasks.append((handlers, chunk))
+
+    def merge(task, result):
+        (handlers, chunk) = task
+        merge_rows([row for (row_namespace, row_id, row) in chunk], result)
+
+    run_tasks(_process_row_chunk, tasks, jobs, merge)
@@ -16,12 +16,14 @@
 # You should have received a copy of the GNU General Public License
 # along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
 
-from filterbase import Filter
+from filterbase import Filter, RowFilter
 
-class StripEmptyCells(Filter):
+class StripEmptyCells(RowFilter):
     '''
     Filter to remove cells with empty values, producing more compact output.
     '''
+    enable_option = 'strip_empty'
+
     def __init__(self, order):
         self.mork_filter_order = order
 
@@ -29,14 +31,20 @@ class StripEmptyCells(Filter):
         parser.add_option('-s', '--strip-empty', action='store_true',
             help="don't include empty cells in the output")
 
-    def process(self, db, opts):
+    def start(self, db, opts):
         if not opts.strip_empty:
-            return
+            return None
 
-        for (row_namespace, row_id, row) in db.rows.items():
-            for (col, val) in row.items():
-                if not val:
-                    del row[col]
+        return db.schema
+
+    def process_row(self, state, row_namespace, row_id, row):
+        schema = state
+        for (col, val) in row.items():
+            # Typed values (like 0 or False) can be false without being
+            # empty once they're written out.
+            if not val and (isinstance(val, basestring) or
+                            schema[(row_namespace, col)].format(val) == ''):
+                del row[col]
 
 strip_empty_filter = StripEmptyCells(4400)
 
@@ -44,6 +52,8 @@ class StripMetaTables(Filter):
     '''
     Filter to remove meta-tables, since they aren't necessarily useful to see.
     '''
+    enable_option = 'strip_meta'
+
     def __init__(self, order):
         self.mork_filter_order = order
 
@@ -57,5 +67,20 @@ class StripMetaTables(Filter):
 
         db.meta_tables.clear()
 
+    def stream(self, db, opts, events):
+        if not opts.strip_meta:
+            return events
+
+        return self._strip(events)
+
+    def _strip(self, events):
+        for event in events:
+            (table_ns, table_id, row_ns, row_id, row) = event
+            if row_ns is None and row is not None:
+                # A meta-table.
+                continue
+
+            yield event
+
 # Meta-tables might be necessary for other filters, so they get removed late.
 strip_metatables_filter = StripMetaTables(9900)
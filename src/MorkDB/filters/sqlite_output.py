@@ -0,0 +1,367 @@
+# Copyright 2010 Kevin Goodsell
+#
+# Output filter for writing Mork databases to an SQLite database file.
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import errno
+import datetime
+
+from filterbase import Filter
+import streaming
+
+# Each Mork table becomes an SQL table named 'namespace-id' (like the CSV
+# output files), with row_namespace and row_id columns followed by a column
+# for each Mork column, in the order they're first seen. Cells a row doesn't
+# have are NULL. Everything else goes into side tables:
+#
+#   mork_tables     (name, namespace, id)     - the SQL table for each table
+#   mork_columns    (table_name, name, mork_column)
+#                                             - the SQL column for each Mork
+#                                               column, where the names can
+#                                               differ (SQL names ignore case)
+#   mork_meta_cells (table_namespace, table_id, mork_column, value)
+#   mork_meta_rows  (table_namespace, table_id, row_namespace, row_id,
+#                    mork_column, value)      - meta-table cells and rows
+#   mork_dicts      (namespace, id, value)    - the raw atom and column dicts
+#
+# With --typed, integer and boolean columns are declared INTEGER and hold
+# numbers, times are ISO 8601 text, and other converted values are text.
+
+_side_tables = [
+    'mork_tables (name TEXT PRIMARY KEY, namespace TEXT, id TEXT)',
+    'mork_columns (table_name TEXT, name TEXT, mork_column TEXT)',
+    'mork_meta_cells (table_namespace TEXT, table_id TEXT, '
+        'mork_column TEXT, value)',
+    'mork_meta_rows (table_namespace TEXT, table_id TEXT, '
+        'row_namespace TEXT, row_id TEXT, mork_column TEXT, value)',
+    'mork_dicts (namespace TEXT, id TEXT, value)',
+]
+
+def _sqlite_opt_callback(option, opt_str, value, parser):
+    parser.values.sqlite = value
+    parser.values.out_format = 'sqlite'
+
+class SqliteOutput(Filter):
+    '''
+    Filter that writes Mork databases to an SQLite database.
+    '''
+    enable_option = 'out_format'
+    enable_value = 'sqlite'
+
+    def __init__(self, order):
+        self.mork_filter_order = order
+
+    def add_options(self, parser):
+        parser.add_option('--sqlite', metavar='FILE', action='callback',
+            callback=_sqlite_opt_callback, type='string',
+            help='output an SQLite database to FILE, with an SQL table for '
+                 'each table')
+        parser.add_option('--sqlite-index', metavar='COLUMN',
+            action='append',
+            help='for SQLite output, also index COLUMN in the tables that '
+                 'have it (can be given more than once)')
+
+        parser.set_defaults(sqlite_index=[])
+
+    def process(self, db, opts):
+        if opts.out_format != 'sqlite':
+            return
+
+        streaming.drain(self.stream(db, opts, streaming.events(db)))
+
+    def stream(self, db, opts, events):
+        if opts.out_format != 'sqlite':
+            return events
+
+        return self._output(db, opts, events)
+
+    def _output(self, db, opts, events):
+        loader = _Loader(opts.sqlite, db.schema, opts.sqlite_index)
+        # The dicts aren't released while streaming, so they can be written
+        # first.
+        loader.write_dicts(db.dicts)
+
+        for event in events:
+            (namespace, oid, row_namespace, row_id, row) = event
+            if row_namespace is not None:
+                loader.add_row(row_namespace, row_id, row)
+            elif row is not None:
+                loader.write_meta_table(namespace, oid, row)
+            else:
+                loader.start_table(namespace, oid)
+
+            yield event
+
+        loader.close()
+
+sqlite_filter = SqliteOutput(10050)
+
+def _quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+def _unique_name(name, taken):
+    '''
+    Return name, or name with a number added if it's already in taken (a set
+    of lowercase names, since SQL names ignore case), and add it to taken.
+    '''
+    result = name
+    number = 1
+    while result.lower() in taken:
+        number += 1
+        result = '%s_%d' % (name, number)
+
+    taken.add(result.lower())
+    return result
+
+def _sql_value(value):
+    '''
+    Return value in a form sqlite3 can store.
+    '''
+    if isinstance(value, unicode):
+        return value
+    elif isinstance(value, str):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            return buffer(value)
+    elif isinstance(value, (bool, int, long, float)):
+        if isinstance(value, (int, long)) and not -2**63 <= value < 2**63:
+            return unicode(value)
+        return value
+    elif isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    else:
+        return None
+
+class _Loader(object):
+    '''
+    Loads tables into an SQLite database. Rows are inserted in batches with
+    executemany, in large transactions. The database is in WAL mode with
+    synchronous writes off during the load; indexes are created once the
+    tables are loaded.
+    '''
+    # Rows to insert in each executemany.
+    _batch_size = 5000
+    # Rows to insert in each transaction.
+    _transaction_size = 100000
+
+    def __init__(self, filename, schema, index_columns):
+        import sqlite3
+        self._sqlite3 = sqlite3
+
+        # Loading into an existing database would mix old and new tables.
+        if os.path.exists(filename):
+            raise OSError(errno.EEXIST, os.strerror(errno.EEXIST), filename)
+
+        self.filename = filename
+        self.schema = schema
+        self.index_columns = index_columns
+        # Transactions are handled here rather than by the sqlite3 module.
+        self.conn = sqlite3.connect(filename, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('BEGIN')
+        for table in _side_tables:
+            self.conn.execute('CREATE TABLE %s' % table)
+
+        self._table_names = set(['mork_tables', 'mork_columns',
+                                 'mork_meta_cells', 'mork_meta_rows',
+                                 'mork_dicts'])
+        # [_TableState], in the order they were created.
+        self._tables = []
+        self._table = None
+        self._uncommitted = 0
+
+    def write_dicts(self, dicts):
+        rows = []
+        for (namespace, mork_dict) in dicts.iteritems():
+            for (oid, value) in mork_dict.iteritems():
+                rows.append((namespace, oid, _sql_value(value)))
+
+        self.conn.executemany('INSERT INTO mork_dicts VALUES (?, ?, ?)', rows)
+
+    def start_table(self, namespace, oid):
+        self._flush()
+        name = _unique_name('%s-%s' % (namespace, oid), self._table_names)
+        self.conn.execute('CREATE TABLE %s (row_namespace TEXT, row_id TEXT)'
+                          % _quote(name))
+        self.conn.execute('INSERT INTO mork_tables VALUES (?, ?, ?)',
+                          (name, namespace, oid))
+        self._table = _TableState(name)
+        self._tables.append(self._table)
+
+    def add_row(self, row_namespace, row_id, row):
+        table = self._table
+        table.batch.append((row_namespace, row_id, row))
+        if len(table.batch) >= self._batch_size:
+            self._flush()
+
+    def _flush(self):
+        table = self._table
+        if table is None or not table.batch:
+            return
+
+        batch = table.batch
+        table.batch = []
+        self._add_columns(table, batch)
+
+        columns = table.mork_columns
+        # Converted values (see --typed) are the only ones that might not be
+        # text, so they're the only ones that are checked, apart from
+        # integers and booleans, which sqlite3 takes as they are.
+        typed = {}
+        rows = []
+        for (row_namespace, row_id, row) in batch:
+            indices = typed.get(row_namespace)
+            if indices is None:
+                indices = typed[row_namespace] = [
+                    i + 2 for (i, column) in enumerate(columns)
+                    if self._needs_checking(row_namespace, column)]
+
+            values = [row_namespace, row_id]
+            values.extend([row.get(column) for column in columns])
+            for i in indices:
+                values[i] = self._typed_value(row_namespace, columns[i - 2],
+                                              values[i])
+            rows.append(values)
+
+        self.conn.execute('SAVEPOINT batch')
+        try:
+            self.conn.executemany(table.insert, rows)
+        except (self._sqlite3.InterfaceError, self._sqlite3.ProgrammingError,
+                OverflowError):
+            # Something that isn't text slipped through (a byte string, for
+            # example), so do it again checking every value.
+            self.conn.execute('ROLLBACK TO batch')
+            rows = [[_sql_value(value) for value in values]
+                    for values in rows]
+            self.conn.executemany(table.insert, rows)
+        self.conn.execute('RELEASE batch')
+
+        self._uncommitted += len(rows)
+        if self._uncommitted >= self._transaction_size:
+            self.conn.execute('COMMIT')
+            self.conn.execute('BEGIN')
+            self._uncommitted = 0
+
+    def _needs_checking(self, row_namespace, column):
+        column_type = self.schema.get((row_namespace, column))
+        return (column_type is not None and
+                column_type.kind not in ('integer', 'boolean'))
+
+    def _typed_value(self, row_namespace, column, value):
+        if value is None or isinstance(value, basestring):
+            return value
+
+        result = _sql_value(value)
+        if result is None:
+            # Flags, for example.
+            result = self.schema[(row_namespace, column)].format(value)
+
+        return result
+
+    def _add_columns(self, table, batch):
+        # Add columns that first appear in batch.
+        known = table.sql_columns
+        new = set()
+        for (row_namespace, row_id, row) in batch:
+            for column in row:
+                if column not in known:
+                    new.add(column)
+
+        if not new:
+            return
+
+        for column in sorted(new):
+            name = _unique_name(column, table.taken)
+            known[column] = name
+            table.mork_columns.append(column)
+            self.conn.execute('ALTER TABLE %s ADD COLUMN %s%s' % (
+                _quote(table.name), _quote(name),
+                self._column_type(column)))
+            self.conn.execute('INSERT INTO mork_columns VALUES (?, ?, ?)',
+                              (table.name, name, column))
+
+        table.insert = 'INSERT INTO %s (row_namespace, row_id, %s) ' \
+                       'VALUES (%s)' % (
+            _quote(table.name),
+            ', '.join([_quote(known[column])
+                       for column in table.mork_columns]),
+            ', '.join(['?'] * (len(table.mork_columns) + 2)))
+
+    def _column_type(self, column):
+        # Columns of integers and booleans (with --typed) are declared
+        # INTEGER, so they sort and compare as numbers. The type is only
+        # known by row namespace, so any will do.
+        for ((row_namespace, name), column_type) in self.schema.iteritems():
+            if name == column and column_type.kind in ('integer', 'boolean'):
+                return ' INTEGER'
+
+        return ''
+
+    def write_meta_table(self, namespace, oid, meta):
+        self.conn.executemany(
+            'INSERT INTO mork_meta_cells VALUES (?, ?, ?, ?)',
+            [(namespace, oid, column, _sql_value(value))
+             for (column, value) in meta.cells.iteritems()])
+        rows = []
+        for (row_namespace, row_id, row) in meta.rows:
+            for (column, value) in row.iteritems():
+                rows.append((namespace, oid, row_namespace, row_id, column,
+                             _sql_value(self._typed_value(row_namespace,
+                                                          column, value))))
+        self.conn.executemany(
+            'INSERT INTO mork_meta_rows VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def close(self):
+        self._flush()
+        self.conn.execute('COMMIT')
+
+        # Indexes are quicker to build once the rows are in.
+        self.conn.execute('BEGIN')
+        for (number, table) in enumerate(self._tables):
+            name = _quote(table.name)
+            self.conn.execute('CREATE INDEX %s ON %s (row_namespace, row_id)'
+                              % (_quote('mork_index_%d' % number), name))
+            for column in self.index_columns:
+                sql_column = table.sql_columns.get(column)
+                if sql_column is not None:
+                    self.conn.execute('CREATE INDEX %s ON %s (%s)' % (
+                        _quote('mork_index_%d_%s' % (number, sql_column)),
+                        name, _quote(sql_column)))
+        self.conn.execute('COMMIT')
+
+        # Leave the database in the usual rollback journal mode, so it's a
+        # single file that can be opened read-only.
+        self.conn.execute('PRAGMA journal_mode = DELETE')
+        self.conn.close()
+
+class _TableState(object):
+    '''
+    What _Loader knows about the SQL table it's loading.
+    '''
+    def __init__(self, name):
+        self.name = name
+        # Mork columns in SQL column order.
+        self.mork_columns = []
+        # {'mork column' : 'SQL column name'}
+        self.sql_columns = {}
+        # Lowercase SQL column names in use.
+        self.taken = set(['row_namespace', 'row_id'])
+        self.insert = None
+        # [('row namespace', 'row id', MorkRow)] waiting to be inserted.
+        self.batch = []
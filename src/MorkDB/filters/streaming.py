@@ -0,0 +1,143 @@
+# Copyright 2010 Kevin Goodsell
+#
+# Helpers for running filters as a pipeline of streaming stages.
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import weakref
+
+# A streaming filter has a stream(db, opts, events) method that takes an
+# iterable of events and returns an iterable of events (usually by being a
+# generator). Events are tuples:
+#
+#   (table_ns, table_id, None, None, None)     - start of a table
+#   (table_ns, table_id, row_ns, row_id, row)  - a row (MorkRow) in the table
+#   (table_ns, table_id, None, None, meta)     - the table's meta-table
+#                                                (MorkMetaTable), if it has
+#                                                one, after the rows
+#
+# Tables come in database order, each followed by its rows in table order.
+# Stages change rows in place and pass each event on in order. They may hold
+# back a bounded number of events (a batch of rows, say) before passing them
+# on, and output stages may hold on to what they need. When the stream comes
+# from events(db, release=True), rows are dropped from the database once they
+# have been passed on for the last time, so converted values only exist for
+# the rows that are in the pipeline.
+#
+# A row can appear in more than one table. It is changed in place, so stages
+# that aren't idempotent must only handle it the first time it's seen; the
+# rows for which this matters are given by shared_rows(db).
+
+def events(db, release=False):
+    '''
+    Yield the events for db. If release is true, tables and rows are removed
+    from db after they have been passed on for the last time.
+    '''
+    remaining = {}
+    if release:
+        # Uses left for each row that appears more than once.
+        remaining = dict(_appearances(db))
+        for key in remaining.keys():
+            if remaining[key] < 2:
+                del remaining[key]
+
+    for (table_ns, table_id, table) in db.tables.items():
+        yield (table_ns, table_id, None, None, None)
+
+        for i in xrange(len(table)):
+            (row_ns, row_id, row) = table[i]
+            yield (table_ns, table_id, row_ns, row_id, row)
+            if release:
+                table[i] = None
+                _release_row(db, remaining, row_ns, row_id)
+        row = None
+
+        meta = db.meta_tables.get((table_ns, table_id))
+        if meta is not None:
+            yield (table_ns, table_id, None, None, meta)
+            if release:
+                for (row_ns, row_id, row) in meta.rows:
+                    _release_row(db, remaining, row_ns, row_id)
+                del db.meta_tables[table_ns, table_id]
+            meta = None
+
+        if release:
+            del db.tables[table_ns, table_id]
+
+def _release_row(db, remaining, row_ns, row_id):
+    key = (row_ns, row_id)
+    count = remaining.get(key)
+    if count is not None:
+        if count > 1:
+            remaining[key] = count - 1
+            return
+        del remaining[key]
+
+    db.rows.pop(key, None)
+
+def _appearances(db):
+    counts = {}
+    for (table_ns, table_id, table) in db.tables.items():
+        for (row_ns, row_id, row) in table:
+            key = (row_ns, row_id)
+            counts[key] = counts.get(key, 0) + 1
+
+    for (table_ns, table_id, meta) in db.meta_tables.items():
+        for (row_ns, row_id, row) in meta.rows:
+            key = (row_ns, row_id)
+            counts[key] = counts.get(key, 0) + 1
+
+    return counts.iteritems()
+
+# { MorkDatabase : set([('row namespace', 'row id')]) }
+_shared = weakref.WeakKeyDictionary()
+
+def shared_rows(db):
+    '''
+    Return the set of (row namespace, row id) for rows that appear in more
+    than one place in the tables and meta-tables of db. This is worked out
+    once per database, before any rows are released.
+    '''
+    shared = _shared.get(db)
+    if shared is None:
+        shared = _shared[db] = set([key for (key, count) in _appearances(db)
+                                    if count > 1])
+
+    return shared
+
+def event_rows(event):
+    '''
+    Return the (row namespace, row id, row) list carried by event: the row
+    for a row event, the meta-table rows for a meta-table event, and nothing
+    for the start of a table.
+    '''
+    (table_ns, table_id, row_ns, row_id, row) = event
+    if row_ns is not None:
+        return [(row_ns, row_id, row)]
+    elif row is not None:
+        return row.rows
+    else:
+        return []
+
+def drain(events):
+    '''
+    Pull every event through a pipeline. Returns the number of row events.
+    '''
+    rows = 0
+    for (table_ns, table_id, row_ns, row_id, row) in events:
+        if row_ns is not None:
+            rows += 1
+
+    return rows
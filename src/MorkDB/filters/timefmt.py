@@ -0,0 +1,241 @@
+# Copyright 2010 Kevin Goodsell
+#
+# Formatting of times for the field converters, with the local time offset
+# cached for each hour so that time.localtime isn't needed for every value.
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import calendar
+import datetime
+import re
+
+# time.localtime can be slow (when TZ isn't set, the C library checks the
+# zone file on every call), while time.gmtime is cheap. Time zone offsets
+# only change on the hour in practice, so the offset is worked out once per
+# hour of UTC and local times are made by applying it and using gmtime. An
+# hour in which the offset changes is left to localtime, and so are formats
+# that show the zone (%Z and %z), since gmtime's result doesn't carry it.
+# Zones that count leap seconds ("right/" zones) make gmtime count them too,
+# so they always use localtime.
+
+_directive_matcher = re.compile('%(.)', re.DOTALL)
+
+def _utc_offset(seconds):
+    return calendar.timegm(time.localtime(seconds)) - seconds
+
+def _hour_offset(hour):
+    '''
+    Return the local time offset for an hour of UTC (counted from the
+    epoch), or None if it isn't the same for the whole hour.
+    '''
+    start = hour * 3600
+    offset = _utc_offset(start)
+    if _utc_offset(start + 3599) != offset:
+        return None
+
+    return offset
+
+def _leap_seconds():
+    # Mid-2017, after 27 leap seconds.
+    seconds = 1500000000
+    return calendar.timegm(time.gmtime(seconds)) != seconds
+
+class TimeFormatter(object):
+    '''
+    Formats times with time.strftime(fmt, ...), giving exactly what
+    time.strftime(fmt, time.localtime(seconds)) would, or the same with
+    time.gmtime if utc is true.
+    '''
+    def __init__(self, fmt, utc=False):
+        self.utc = utc
+        directives = set(_directive_matcher.findall(fmt))
+        if utc:
+            # strftime would give the local zone for these.
+            fmt = _directive_matcher.sub(_utc_directive, fmt)
+        self.format = fmt
+        self._use_localtime = not utc and ('Z' in directives or
+                                           'z' in directives or
+                                           _leap_seconds())
+
+        # {hour : offset or None}
+        self._offsets = {}
+
+    def format_seconds(self, seconds):
+        '''
+        Format an integer number of seconds since the epoch. Raises
+        ValueError for times the platform can't handle.
+        '''
+        if self.utc:
+            return time.strftime(self.format, time.gmtime(seconds))
+        if self._use_localtime:
+            return time.strftime(self.format, time.localtime(seconds))
+
+        offset = self._hour_offset(seconds)
+        if offset is None:
+            return time.strftime(self.format, time.localtime(seconds))
+
+        return time.strftime(self.format, time.gmtime(seconds + offset))
+
+    def _hour_offset(self, seconds):
+        hour = seconds // 3600
+        try:
+            return self._offsets[hour]
+        except KeyError:
+            offset = self._offsets[hour] = _hour_offset(hour)
+            return offset
+
+    def utc_offset(self, seconds):
+        '''
+        Return the offset from UTC, in seconds, of the times this formatter
+        shows for seconds since the epoch.
+        '''
+        if self.utc:
+            return 0
+
+        offset = self._hour_offset(seconds)
+        if offset is None:
+            return _utc_offset(seconds)
+
+        return offset
+
+    def format_datetime(self, dt):
+        '''
+        Format an aware datetime the same way as the number of seconds since
+        the epoch it stands for (dropping any fraction of a second).
+        '''
+        return self.format_seconds(calendar.timegm(dt.utctimetuple()))
+
+    def format_struct(self, t):
+        '''
+        Format a time.struct_time (or 9-tuple) holding a local time. If utc
+        is true, it's converted to UTC first. Raises ValueError for times
+        the platform can't handle.
+        '''
+        if self.utc:
+            try:
+                t = time.gmtime(time.mktime(t))
+            except OverflowError, e:
+                raise ValueError(str(e))
+
+        return time.strftime(self.format, t)
+
+def _utc_directive(match):
+    directive = match.group(1)
+    if directive == 'Z':
+        return 'UTC'
+    elif directive == 'z':
+        return '+0000'
+    else:
+        return match.group(0)
+
+# { (format, utc) : TimeFormatter }
+_formatters = {}
+
+def formatter(fmt, utc=False):
+    '''
+    Return a TimeFormatter for fmt, shared with other users of the same
+    format.
+    '''
+    result = _formatters.get((fmt, utc))
+    if result is None:
+        result = _formatters[fmt, utc] = TimeFormatter(fmt, utc)
+
+    return result
+
+class FixedOffset(datetime.tzinfo):
+    '''
+    A time zone with a fixed offset from UTC, given in seconds (which must be
+    whole minutes) east of UTC.
+    '''
+    def __init__(self, offset):
+        self._seconds = offset
+        self._offset = datetime.timedelta(seconds=offset)
+        if offset == 0:
+            self._name = 'UTC'
+        else:
+            (hours, minutes) = divmod(abs(offset) // 60, 60)
+            self._name = 'UTC%s%02d:%02d' % ('-+'[offset > 0], hours, minutes)
+
+    def __getinitargs__(self):
+        return (self._seconds,)
+
+    def __repr__(self):
+        return 'FixedOffset(%d)' % self._seconds
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return datetime.timedelta(0)
+
+    def tzname(self, dt):
+        return self._name
+
+# { seconds : FixedOffset }
+_fixed_offsets = {}
+
+_epoch = datetime.datetime(1970, 1, 1)
+
+def to_datetime(seconds, microseconds, offset):
+    '''
+    Return the aware datetime for seconds (plus microseconds) since the
+    epoch, in the time zone offset seconds east of UTC. Raises ValueError or
+    OverflowError if it can't be represented.
+    '''
+    tz = _fixed_offsets.get(offset)
+    if tz is None:
+        tz = _fixed_offsets[offset] = FixedOffset(offset)
+
+    local = _epoch + datetime.timedelta(seconds=seconds + offset,
+                                        microseconds=microseconds)
+    return local.replace(tzinfo=tz)
+
+# The format of time.ctime() and C's asctime(), as used by Thunderbird for
+# LastPurgeTime.
+ctime_format = '%a %b %d %H:%M:%S %Y'
+
+_days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+_months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+           'Oct', 'Nov', 'Dec']
+_ctime_matcher = re.compile(r'(%s) (%s) +(\d{1,2}) (\d\d):(\d\d):(\d\d) '
+                            r'(\d{4})\Z' % ('|'.join(_days),
+                                            '|'.join(_months)))
+
+def parse_ctime(value):
+    '''
+    Parse a time in ctime_format, giving the same result as
+    time.strptime(value, ctime_format). Values in the usual form are parsed
+    directly; anything else is left to strptime.
+    '''
+    match = _ctime_matcher.match(value)
+    if match is None:
+        return time.strptime(value, ctime_format)
+
+    (day_name, month_name, day, hour, minute, second, year) = match.groups()
+    month = _months.index(month_name) + 1
+    (day, hour, minute, second, year) = (int(day), int(hour), int(minute),
+                                         int(second), int(year))
+    try:
+        yday = datetime.date(year, month, day).timetuple().tm_yday
+    except ValueError:
+        return time.strptime(value, ctime_format)
+
+    if hour > 23 or minute > 59 or second > 59:
+        return time.strptime(value, ctime_format)
+
+    # strptime keeps the day name it was given, even if it's wrong.
+    return time.struct_time((year, month, day, hour, minute, second,
+                             _days.index(day_name), yday, -1))
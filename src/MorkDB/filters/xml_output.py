@@ -22,16 +22,22 @@
 
 import re
 import warnings
-import sys
 
 from filterbase import Filter
-from encoding import EncodingStream
+from encoding import open_output
+import streaming
 
 # Filter is available as a base class for filter classes, but it's not
 # necessary. Filters can be classes or class instances. In this case it
 # will be an instance.
 class XmlOutput(Filter):
     '''Filter to produce XML output.'''
+    # OPTIONAL: These tell the driver which option value enables the filter,
+    # so it can be skipped entirely when it has nothing to do. See
+    # filterbase.py.
+    enable_option = 'out_format'
+    enable_value = 'xml'
+
     def __init__(self, order, indent_str='    '):
         # REQUIRED: All filters, whether class or instance, must have a
         # mork_filter_order attribute, and the value must be non-negative for
@@ -39,6 +45,10 @@ class XmlOutput(Filter):
         # dictated by these attributes.
         self.mork_filter_order = order
         self._indent_str = indent_str
+        # { indent string : { (indent, 'column') : cell start tag } }
+        self._cell_start_memos = {}
+        # { 'namespace' : formatted attribute }
+        self._attributes = {}
 
     # REQUIRED: All filters have an add_options method. It takes an instance
     # of optparse.OptionParser, and should add any filter-specific options.
@@ -50,6 +60,8 @@ class XmlOutput(Filter):
         # value is just a string identifier that some filter should recognize.
         parser.add_option('--xml', dest='out_format', action='store_const',
             const='xml', help='output XML (default)')
+        parser.add_option('--xml-compact', action='store_true',
+            help="for XML output, don't indent elements")
 
         # Filters for doing output should usually set the out_format option
         # value to whatever format they recognize. This way, the default
@@ -66,79 +78,143 @@ class XmlOutput(Filter):
         if opts.out_format != 'xml':
             return
 
-        if opts.outname is None or opts.outname == '-':
-            f = EncodingStream(opts.out_encoding, sys.stdout)
-        else:
-            f = EncodingStream.open(opts.out_encoding, opts.outname)
-
-        self._output(db, f)
-
-    def _output(self, db, f):
-        print >> f, '<?xml version="1.0"?>'
-        print >> f, '<morkxml>'
-
-        for (namespace, oid, table) in db.tables.items():
-            meta = db.meta_tables.get((namespace, oid))
-            self._write_table(f, namespace, oid, table, meta)
-
-        print >> f, '</morkxml>'
+        # The database is written out the same way it's streamed, just
+        # without releasing anything.
+        streaming.drain(self.stream(db, opts, streaming.events(db)))
 
-    def _write_table(self, f, namespace, oid, table, meta=None, indent=1):
-        indent_str = self._indent_str * indent
-        print >> f, '%s<table namespace=%s id=%s>' % (indent_str,
-            self._format_attribute(namespace), self._format_attribute(oid))
-
-        for (row_namespace, row_id, row) in table:
-            self._write_row(f, row_namespace, row_id, row, indent + 1)
-
-        if meta is not None:
-            self._write_meta_table(f, meta, indent + 1)
-
-        print >> f, '%s</table>' % indent_str
+    # OPTIONAL: A stream method lets the filter be part of a streaming
+    # pipeline, where the rows arrive as events and the database is released
+    # as it is written (see streaming.py). It returns the events, passed on
+    # unchanged for an output filter.
+    def stream(self, db, opts, events):
+        if opts.out_format != 'xml':
+            return events
 
-    def _write_meta_table(self, f, meta, indent):
-        indent_str = self._indent_str * indent
-        print >> f, '%s<metatable>' % indent_str
+        if opts.xml_compact:
+            indent_str = ''
+        else:
+            indent_str = self._indent_str
+
+        f = open_output(opts.out_encoding, opts.outname, opts)
+        return self._output(f, db.schema, events, indent_str)
+
+    def _output(self, f, schema, events, indent_str):
+        # The output is built up as a list of fragments and written in
+        # chunks.
+        out = ['<?xml version="1.0"?>\n', '<morkxml>\n']
+        cells = self._cell_starts(indent_str)
+
+        in_table = False
+        for event in events:
+            (namespace, oid, row_namespace, row_id, row) = event
+            if row_namespace is not None:
+                self._write_row(out, cells, schema, row_namespace, row_id,
+                                row, indent_str, 2)
+            elif row is not None:
+                self._write_meta_table(out, cells, schema, row, indent_str,
+                                       2)
+            else:
+                if in_table:
+                    out.append('%s</table>\n' % indent_str)
+                out.append('%s<table namespace=%s id=%s>\n' % (
+                    indent_str, self._format_attribute(namespace),
+                    self._format_attribute(oid)))
+                in_table = True
+
+            if len(out) >= self._chunk_fragments:
+                f.write(''.join(out))
+                out = []
+
+            yield event
+
+        if in_table:
+            out.append('%s</table>\n' % indent_str)
+
+        out.append('</morkxml>\n')
+        f.write(''.join(out))
+        f.close()
+
+    # Fragments to collect before writing them out.
+    _chunk_fragments = 4096
+
+    def _cell_starts(self, indent_str):
+        '''
+        Return the dict used to memoize the start of a cell element (the
+        indent and the start tag), by (indent, column).
+        '''
+        cells = self._cell_start_memos.get(indent_str)
+        if cells is None:
+            cells = self._cell_start_memos[indent_str] = {}
+
+        return cells
+
+    def _cell_start(self, cells, indent_str, column, indent):
+        key = (indent, column)
+        start = cells.get(key)
+        if start is None:
+            start = cells[key] = '%s<cell column=%s>' % (
+                indent_str * indent, self._format_attribute(column))
+
+        return start
+
+    def _write_meta_table(self, out, cells, schema, meta, indent_str, indent):
+        indent_text = indent_str * indent
+        out.append('%s<metatable>\n' % indent_text)
 
         for (column, value) in meta.cells.items():
-            self._write_cell(f, column, value, indent + 1)
+            self._write_cell(out, cells, column, value, indent_str, indent + 1)
 
         for (namespace, oid, row) in meta.rows:
-            self._write_row(f, namespace, oid, row, indent + 1)
-
-        print >> f, '%s</metatable>' % indent_str
-
-    def _write_row(self, f, namespace, oid, row, indent):
-        indent_str = self._indent_str * indent
-        print >> f, '%s<row namespace=%s id=%s>' % (indent_str,
-            self._format_attribute(namespace), self._format_attribute(oid))
-
-        for (column, value) in row.items():
-            self._write_cell(f, column, value, indent + 1)
-
-        print >> f, '%s</row>' % indent_str
-
-    def _write_cell(self, f, column, value, indent):
-        indent_str = self._indent_str * indent
-        print >> f, '%s<cell column=%s>%s</cell>' % (indent_str,
-            self._format_attribute(column), self._format_element_text(value))
-
-    # Regex for stuff that's not in the 'Char' production of the XML grammar
+            self._write_row(out, cells, schema, namespace, oid, row,
+                            indent_str, indent + 1)
+
+        out.append('%s</metatable>\n' % indent_text)
+
+    def _write_row(self, out, cells, schema, namespace, oid, row, indent_str,
+                   indent):
+        indent_text = indent_str * indent
+        out.append('%s<row namespace=%s id=%s>\n' % (indent_text,
+            self._format_attribute(namespace), self._format_attribute(oid)))
+
+        append = out.append
+        format_text = self._format_element_text
+        cell_indent = indent + 1
+        for (column, value) in row.iteritems():
+            if schema and not isinstance(value, basestring):
+                # A typed value (see --typed).
+                value = schema[(namespace, column)].format(value)
+
+            start = cells.get((cell_indent, column))
+            if start is None:
+                start = self._cell_start(cells, indent_str, column,
+                                         cell_indent)
+            append(start)
+            append(format_text(value))
+            append('</cell>\n')
+
+        append('%s</row>\n' % indent_text)
+
+    def _write_cell(self, out, cells, column, value, indent_str, indent):
+        out.append(self._cell_start(cells, indent_str, column, indent))
+        out.append(self._format_element_text(value))
+        out.append('</cell>\n')
+
+    # Characters that are not in the 'Char' production of the XML grammar,
+    # for use in a character class. (A single class is much quicker to
+    # match than an alternation of classes.)
     _non_char = (
-        u'['
         u'\x00-\x08\x0B\x0C\x0E-\x1F'  # Control characters
         u'\uD800-\uDFFF'               # Surrogates
         u'\uFFFE\uFFFF'                # Permanently unassigned (BOM)
-        u']'
     )
 
     # Regex for stuff that's not in the 'AttValue' production in the XML
     # grammar. '>' is also included for symmetry.
-    _non_att_value_matcher = re.compile(_non_char + u'|[<>&"]')
+    _non_att_value_matcher = re.compile(u'[' + _non_char + u'<>&"]')
 
     # Regex for stuff that's not in the 'CharData' production in the XML
     # grammar. '>' is also included for symmetry.
-    _non_char_data_matcher = re.compile(_non_char + u'|[<>&]')
+    _non_char_data_matcher = re.compile(u'[' + _non_char + u'<>&]')
     # For reference, the version without '>' requires including ']]>':
     #_non_char_data_matcher = re.compile(_non_char + u'|[<&]|]]>')
 
@@ -163,11 +239,32 @@ class XmlOutput(Filter):
         return new
 
     def _format_attribute(self, value):
-        # This corresponds to 'AttValue' in the spec.
-        return '"%s"' % self._non_att_value_matcher.sub(self._replacer, value)
+        # This corresponds to 'AttValue' in the spec. Namespaces and columns
+        # repeat, so they're remembered.
+        result = self._attributes.get(value)
+        if result is None:
+            if value.isalnum():
+                # Nothing to escape (like most ids).
+                return '"%s"' % value
+
+            result = '"%s"' % self._non_att_value_matcher.sub(self._replacer,
+                                                              value)
+            if len(self._attributes) < self._max_attributes:
+                self._attributes[value] = result
+
+        return result
+
+    # Limit on remembered attributes, since ids are mostly unique.
+    _max_attributes = 10000
 
     def _format_element_text(self, value):
-        # This correspond to 'CharData' in the spec.
+        # This correspond to 'CharData' in the spec. Letters and digits never
+        # need escaping, and most other values don't either.
+        if value.isalnum():
+            return value
+        if self._non_char_data_matcher.search(value) is None:
+            return value
+
         return self._non_char_data_matcher.sub(self._replacer, value)
 
 # Since XML is to be the default output, its order should be the highest.
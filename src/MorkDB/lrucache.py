@@ -0,0 +1,141 @@
+'''
+Copyright 2010 Kevin Goodsell
+
+lrucache.py -- bounded least-recently-used caches that keep hit and miss
+counts, so repeated values can be converted once and the benefit reported.
+'''
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import weakref
+
+# Every cache registers itself here so the statistics can be reported without
+# the caller having to know which caches exist.
+_caches = []
+
+# Indices into the linked-list entries.
+_PREV, _NEXT, _KEY, _VALUE = range(4)
+
+class LRUCache(object):
+    '''
+    A mapping that holds at most maxsize items, discarding the least recently
+    used item when it is full.
+    '''
+    def __init__(self, name, maxsize=10000):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+        # Entries are [prev, next, key, value] lists forming a circular
+        # doubly-linked list through self._root, most recently used last.
+        self._map = {}
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+
+        _caches.append(weakref.ref(self))
+
+    # Caches are sent to worker processes along with the filters that own
+    # them, but only the settings go along, not the contents.
+    def __getstate__(self):
+        return (self.name, self.maxsize)
+
+    def __setstate__(self, state):
+        (name, maxsize) = state
+        self.__init__(name, maxsize)
+
+    def __len__(self):
+        return len(self._map)
+
+    def get(self, key, default=None):
+        link = self._map.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        root = self._root
+        last = root[_PREV]
+        if link is not last:
+            # Move the entry to the most recently used end.
+            (prev, next) = (link[_PREV], link[_NEXT])
+            prev[_NEXT] = next
+            next[_PREV] = prev
+            last[_NEXT] = root[_PREV] = link
+            link[_PREV] = last
+            link[_NEXT] = root
+
+        return link[_VALUE]
+
+    def put(self, key, value):
+        link = self._map.get(key)
+        if link is not None:
+            link[_VALUE] = value
+            return
+
+        if len(self._map) >= self.maxsize:
+            # Recycle the oldest entry.
+            oldest = self._root[_NEXT]
+            del self._map[oldest[_KEY]]
+            self._root[_NEXT] = oldest[_NEXT]
+            oldest[_NEXT][_PREV] = self._root
+
+        last = self._root[_PREV]
+        link = [last, self._root, key, value]
+        last[_NEXT] = self._root[_PREV] = self._map[key] = link
+
+    def clear(self):
+        self._map.clear()
+        self._root[:] = [self._root, self._root, None, None]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+
+        return float(self.hits) / lookups
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate(),
+        }
+
+def all_caches():
+    '''
+    Return the caches that are still alive, in order of creation.
+    '''
+    result = []
+    for ref in _caches:
+        cache = ref()
+        if cache is not None:
+            result.append(cache)
+
+    _caches[:] = [weakref.ref(cache) for cache in result]
+    return result
+
+def print_stats(f):
+    for cache in all_caches():
+        if cache.hits + cache.misses == 0:
+            continue
+
+        print >> f, ('%s: %d hits, %d misses (%.1f%% hit rate), %d/%d '
+                     'entries' % (cache.name, cache.hits, cache.misses,
+                                  cache.hit_rate() * 100, len(cache),
+                                  cache.maxsize))
@@ -0,0 +1,219 @@
+'''
+Copyright 2010 Kevin Goodsell
+
+monitor.py -- recording resource usage for the phases of a conversion
+(reading, tokenizing, parsing, building the database, and each filter).
+'''
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class MemoryProbe(object):
+    '''
+    Measures memory use for a phase. With tracemalloc (Python 3, or the
+    pytracemalloc backport) this is the traced heap, with the peak for the
+    phase as peak_kb. Otherwise it falls back on the resident set size of
+    the process, and the only peak available is the highest the process
+    has reached so far (process_peak_kb), which never goes down from one
+    phase to the next.
+    '''
+    name = 'memory'
+
+    def __init__(self):
+        self._tracing = (tracemalloc is not None and
+                         hasattr(tracemalloc, 'reset_peak'))
+        if self._tracing and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self):
+        if self._tracing:
+            tracemalloc.reset_peak()
+            return tracemalloc.get_traced_memory()[0]
+
+        return self._current_rss()
+
+    def stop(self, start_bytes):
+        if self._tracing:
+            (current, peak) = tracemalloc.get_traced_memory()
+            return {
+                'source': 'tracemalloc',
+                'start_kb': _kb(start_bytes),
+                'end_kb': _kb(current),
+                'peak_kb': _kb(peak),
+            }
+
+        return {
+            'source': 'rss',
+            'start_kb': _kb(start_bytes),
+            'end_kb': _kb(self._current_rss()),
+            'process_peak_kb': _kb(self._peak_rss()),
+        }
+
+    def _current_rss(self):
+        try:
+            f = open('/proc/self/statm')
+            try:
+                pages = int(f.read().split()[1])
+            finally:
+                f.close()
+        except (IOError, ValueError, IndexError):
+            return None
+
+        return pages * os.sysconf('SC_PAGE_SIZE')
+
+    def _peak_rss(self):
+        if resource is None:
+            return None
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes, except on Mac OS X where it's in bytes.
+        if sys.platform != 'darwin':
+            peak *= 1024
+
+        return peak
+
+class TimeProbe(object):
+    '''
+    Measures the wall clock and CPU time of a phase, in seconds. CPU time
+    includes finished child processes, so work done with --jobs is counted.
+    '''
+    name = 'time'
+
+    def start(self):
+        return (time.time(), self._cpu())
+
+    def stop(self, state):
+        (wall, cpu) = state
+        return {
+            'wall': time.time() - wall,
+            'cpu': self._cpu() - cpu,
+        }
+
+    def _cpu(self):
+        (user, system, child_user, child_system, elapsed) = os.times()
+        return user + system + child_user + child_system
+
+def _kb(nbytes):
+    if nbytes is None:
+        return None
+
+    return nbytes // 1024
+
+class PhaseMonitor(object):
+    '''
+    Records measurements for each phase of a conversion. Phases are
+    delimited by start() and stop() calls; each probe contributes its
+    measurements to the phase record under its own name.
+
+    If counts is true, the code running the phases is asked to add counts
+    (rows, cells, bytes, tokens) to the records with note(). Counting can
+    take a pass over the data, so it's off by default, and it's done outside
+    the phases (note() after stop() adds to the phase just finished) so it
+    isn't measured.
+    '''
+    def __init__(self, probes=(), counts=False):
+        self.probes = list(probes)
+        self.counts = counts
+        self.phases = []
+        # Anything else to include in the report.
+        self.info = {}
+        self._current = None
+
+    def start(self, name, **info):
+        assert self._current is None, 'phase %r not stopped' % self._current
+        record = {'name': name}
+        record.update(info)
+        states = [probe.start() for probe in self.probes]
+        self._current = (record, states)
+
+    def stop(self):
+        (record, states) = self._current
+        self._current = None
+        for (probe, state) in zip(self.probes, states):
+            record[probe.name] = probe.stop(state)
+
+        self.phases.append(record)
+
+    def measures(self, name):
+        '''
+        Return True if one of the probes is called name ('time', for
+        example).
+        '''
+        for probe in self.probes:
+            if probe.name == name:
+                return True
+
+        return False
+
+    def note(self, **info):
+        '''
+        Add info to the current phase, or to the last one if no phase is
+        running.
+        '''
+        if self._current is not None:
+            record = self._current[0]
+        else:
+            record = self.phases[-1]
+
+        record.update(info)
+
+    def report(self):
+        report = dict(self.info)
+        report['phases'] = self.phases
+        return report
+
+def database_counts(db):
+    '''
+    Return the row and cell counts for db, for use with PhaseMonitor.note().
+    '''
+    cells = 0
+    for row in db.rows.itervalues():
+        cells += len(row)
+
+    return {'rows': len(db.rows), 'cells': cells}
+
+def write_json(report, filename):
+    '''
+    Write report (made of dicts, lists, strings and numbers) as JSON to
+    filename, or to stderr if filename is '-'.
+    '''
+    # json is new in Python 2.6, so it's only imported when a report is
+    # written.
+    import json
+
+    if filename == '-':
+        f = sys.stderr
+    else:
+        f = open(filename, 'w')
+
+    try:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+    finally:
+        if f is not sys.stderr:
+            f.close()
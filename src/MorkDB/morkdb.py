@@ -21,6 +21,7 @@ for building them from Abstract Syntax Trees.
 
 import warnings
 import re
+import sys
 
 import MorkDB.morkast as morkast
 
@@ -113,7 +114,8 @@ class MorkTable(MorkRowList):
     def column_names(self):
         columns = set()
         for (namespace, rowid, row) in self:
-            columns.update(row.column_names())
+            # Rows are dicts of their columns.
+            columns.update(row)
 
         return columns
 
@@ -231,12 +233,24 @@ def process_mork_group_ast(ast, db):
     for item in ast.items:
         db.build_item(item)
 
+def _report_name(name):
+    # Namespaces and ids are byte strings that may not be valid UTF-8, which
+    # the json module can't handle.
+    if isinstance(name, str):
+        return name.decode('utf-8', 'replace')
+
+    return name
+
 class MorkDatabase(object):
     def __init__(self):
         self.dicts = {} # { 'namespace': MorkDict }
         self.tables = MorkTableStore()
         self.meta_tables = MorkTableStore()
         self.rows = MorkRowStore()
+        # { ('row namespace', 'column'): type } for columns whose cells hold
+        # something other than text (see --typed). Types have a format(value)
+        # method giving the text for a cell.
+        self.schema = {}
 
         self.dicts['a'] = MorkDict()
         self.dicts['c'] = MorkDict()
@@ -278,6 +292,11 @@ class MorkDatabase(object):
 
     _escape = re.compile(r'\$[0-9a-fA-F]{2}|\\\r\n|\\.', re.DOTALL)
     def _unescape(self, value):
+        # Most values have nothing to unescape, and checking for that is much
+        # cheaper than a substitution.
+        if '$' not in value and '\\' not in value:
+            return value
+
         return self._escape.sub(self._translateEscape, value)
 
     def _inflateCell(self, cell):
@@ -328,6 +347,78 @@ class MorkDatabase(object):
                 raise NotImplementedError('Unhandled row update type: %r' %
                                           update)
 
+    # **** Memory accounting ****
+
+    def memory_report(self):
+        '''
+        Estimate the memory used by the database, in bytes, broken down by
+        dict namespace, table, and row namespace and column. Strings shared
+        between cells (such as column names) are not counted for each use.
+        The result is made of dicts, lists, strings and numbers so it can be
+        written as JSON.
+        '''
+        sizeof = sys.getsizeof
+
+        dicts = {}
+        for (namespace, mork_dict) in self.dicts.items():
+            size = sizeof(mork_dict)
+            for (key, value) in mork_dict.iteritems():
+                size += sizeof(key) + sizeof(value)
+            dicts[_report_name(namespace)] = size
+
+        tables = []
+        for (namespace, oid, table) in self.tables.items():
+            # The rows themselves are counted under their namespaces.
+            size = sizeof(table) + sum([sizeof(item) for item in table])
+            tables.append({'namespace': _report_name(namespace),
+                           'id': _report_name(oid), 'rows': len(table),
+                           'bytes': size})
+
+        meta_tables = []
+        for (namespace, oid, meta) in self.meta_tables.items():
+            size = sizeof(meta) + sizeof(meta.cells) + sizeof(meta.rows)
+            for value in meta.cells.itervalues():
+                size += sizeof(value)
+            meta_tables.append({'namespace': _report_name(namespace),
+                                'id': _report_name(oid), 'bytes': size})
+
+        rows = {}
+        for (namespace, rowid, row) in self.rows.items():
+            ns_report = rows.get(namespace)
+            if ns_report is None:
+                ns_report = rows[namespace] = {'rows': 0, 'cells': 0,
+                                               'bytes': 0, 'columns': {}}
+            columns = ns_report['columns']
+
+            ns_report['rows'] += 1
+            ns_report['cells'] += len(row)
+            # Row object, its id, and its key in the row store.
+            ns_report['bytes'] += (sizeof(row) + sizeof(rowid) +
+                                   sizeof((namespace, rowid)))
+            for (column, value) in row.iteritems():
+                size = sizeof(value)
+                ns_report['bytes'] += size
+                columns[column] = columns.get(column, 0) + size
+
+        rows = dict([(_report_name(namespace), ns_report)
+                     for (namespace, ns_report) in rows.iteritems()])
+        for ns_report in rows.itervalues():
+            ns_report['columns'] = dict(
+                [(_report_name(column), size)
+                 for (column, size) in ns_report['columns'].iteritems()])
+
+        total = (sum(dicts.values()) +
+                 sum([t['bytes'] for t in tables + meta_tables]) +
+                 sum([r['bytes'] for r in rows.values()]))
+
+        return {
+            'dicts': dicts,
+            'tables': tables,
+            'meta_tables': meta_tables,
+            'row_namespaces': rows,
+            'total_bytes': total,
+        }
+
     # **** Database builder ****
 
     _builder = {
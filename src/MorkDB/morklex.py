@@ -181,8 +181,9 @@ def t_ANY_mac_newline(t):
     t.lexer.lineno += len(t.value)
 
 def t_ANY_error(t):
-    print >> sys.stderr, "Lexing error at line %d, next chars: %r" % (
-        t.lexer.lineno, t.value[:10])
+    if not getattr(t.lexer, 'quiet', False):
+        print >> sys.stderr, "Lexing error at line %d, next chars: %r" % (
+            t.lexer.lineno, t.value[:10])
     t.lexer.skip(1)
 
 lex.lex(reflags=re.MULTILINE)
@@ -197,3 +198,22 @@ def print_tokens(f):
         if not tok:
             break
         print tok
+
+def count_tokens(data):
+    '''
+    Return a dictionary of the number of tokens of each type in data.
+    '''
+    # A copy of the lexer is used so the line numbers seen by the parser
+    # aren't disturbed, and lexing errors are left for the parser's pass to
+    # report.
+    lexer = lex.lexer.clone()
+    lexer.quiet = True
+    lexer.input(data)
+    counts = {}
+    while True:
+        tok = lexer.token()
+        if not tok:
+            break
+        counts[tok.type] = counts.get(tok.type, 0) + 1
+
+    return counts
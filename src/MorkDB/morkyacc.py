@@ -325,29 +325,40 @@ yacc.yacc()
 def parse(data):
     return yacc.parse(data)
 
+def read_file(f):
+    '''
+    Return the contents of f, which may be a file name or a file object.
+    '''
+    if isinstance(f, basestring):
+        f = open(f)
+        try:
+            return f.read()
+        finally:
+            f.close()
+
+    return f.read()
+
 def parse_file(f):
     filename = None
     if isinstance(f, basestring):
         filename = f
         # Read a cached parse tree if possible
-        tree = _get_parse_tree(filename)
+        tree = load_parse_tree(filename)
         if tree:
             return tree
 
-        f = open(filename)
-
-    tree = parse(f.read())
+    tree = parse(read_file(f))
     if filename:
         # Cache the parse tree for later use
-        tree_name = filename + '.parse-tree'
-        try:
-            pickle.dump(tree, open(tree_name, 'w'), pickle.HIGHEST_PROTOCOL)
-        except IOError:
-            pass
+        save_parse_tree(filename, tree)
 
     return tree
 
-def _get_parse_tree(filename):
+def load_parse_tree(filename):
+    '''
+    Return the cached parse tree for filename, or None if there isn't an
+    up-to-date one.
+    '''
     tree_name = filename + '.parse-tree'
     try:
         tree_st = os.stat(tree_name)
@@ -359,3 +370,10 @@ def _get_parse_tree(filename):
         return pickle.load(open(tree_name))
 
     return None
+
+def save_parse_tree(filename, tree):
+    tree_name = filename + '.parse-tree'
+    try:
+        pickle.dump(tree, open(tree_name, 'w'), pickle.HIGHEST_PROTOCOL)
+    except IOError:
+        pass
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# Copyright 2010 Kevin Goodsell
+#
+# Regression check for the JSON Lines and SQLite output filters. It converts
+# sample.mab in this directory, with and without --typed and --streaming,
+# and compares the results with the expected output kept next to it. After
+# an intended change to the output, run it with --update to rewrite the
+# expected files, and check the difference before committing them.
+#
+# The check itself needs Python 2.6 or higher (for json and sqlite3).
+
+# This file is part of mork-converter.
+#
+# mork-converter is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License Version 2 as published
+# by the Free Software Foundation.
+#
+# mork-converter is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with mork-converter.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import os
+import json
+import shutil
+import itertools
+import sqlite3
+import tempfile
+import subprocess
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+mork = os.path.join(os.path.dirname(tests_dir), 'src', 'mork')
+sample = os.path.join(tests_dir, 'sample.mab')
+
+# (expected output file, output options)
+checks = [
+    ('sample.jsonl', ['--jsonl']),
+    ('sample-typed.jsonl', ['--jsonl', '--typed']),
+    ('sample.sql', ['--sqlite', None]),
+    ('sample-typed.sql', ['--sqlite', None, '--typed']),
+]
+
+# Options that mustn't change the output. Expected files are written
+# without them.
+variants = [[], ['--streaming']]
+
+class ConversionError(Exception):
+    pass
+
+def convert(options):
+    '''
+    Convert the sample with options (where None stands for the output file)
+    and return the output: the JSON Lines text, or an SQL dump of the SQLite
+    database.
+    '''
+    temp_dir = tempfile.mkdtemp()
+    try:
+        outname = os.path.join(temp_dir, 'output')
+        if None in options:
+            args = []
+            for opt in options:
+                if opt is None:
+                    opt = outname
+                args.append(opt)
+        else:
+            args = options + ['--outname', outname]
+
+        # Times are converted to local time.
+        env = dict(os.environ)
+        env['TZ'] = 'UTC'
+
+        # The sample is read from stdin, so its parse tree isn't cached next
+        # to it, and mork runs in the temporary directory, where PLY can
+        # leave its parser tables.
+        f = open(sample, 'rb')
+        try:
+            process = subprocess.Popen([sys.executable, mork] + args,
+                                       stdin=f, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, env=env,
+                                       cwd=temp_dir)
+            (out, err) = process.communicate()
+        finally:
+            f.close()
+
+        if process.returncode != 0:
+            raise ConversionError(err)
+
+        if '--sqlite' in options:
+            return sql_dump(outname)
+
+        f = open(outname, 'rb')
+        try:
+            return f.read()
+        finally:
+            f.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+def sql_dump(filename):
+    '''
+    Return an SQL dump of the SQLite database filename, with the rows of
+    each table sorted, since SQL tables have no order.
+    '''
+    conn = sqlite3.connect(filename)
+    try:
+        lines = [line.encode('utf-8') for line in conn.iterdump()]
+    finally:
+        conn.close()
+
+    result = []
+    for (table, group) in itertools.groupby(lines, _insert_table):
+        group = list(group)
+        if table is not None:
+            group.sort()
+        result.extend(group)
+
+    return ''.join(['%s\n' % line for line in result])
+
+def _insert_table(line):
+    if line.startswith('INSERT INTO '):
+        return line.split(' VALUES', 1)[0]
+
+    return None
+
+def same_output(name, expected, actual):
+    if name.endswith('.jsonl'):
+        # Compared as objects, since the order of the cells isn't
+        # significant.
+        return ([json.loads(line) for line in expected.splitlines()] ==
+                [json.loads(line) for line in actual.splitlines()])
+
+    return expected == actual
+
+def update():
+    for (name, options) in checks:
+        f = open(os.path.join(tests_dir, name), 'wb')
+        try:
+            f.write(convert(options))
+        finally:
+            f.close()
+
+        print 'wrote %s' % name
+
+def check():
+    '''
+    Run every check, returning the number that failed.
+    '''
+    failures = 0
+    for (name, options) in checks:
+        f = open(os.path.join(tests_dir, name), 'rb')
+        try:
+            expected = f.read()
+        finally:
+            f.close()
+
+        for variant in variants:
+            description = ' '.join([name] + variant)
+            try:
+                actual = convert(options + variant)
+            except ConversionError, e:
+                print 'FAILED %s: conversion failed\n%s' % (description, e)
+                failures += 1
+                continue
+
+            if same_output(name, expected, actual):
+                print 'ok     %s' % description
+            else:
+                print 'FAILED %s: output differs' % description
+                failures += 1
+
+    return failures
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+
+    if args == ['--update']:
+        update()
+        return 0
+    elif args:
+        print >> sys.stderr, 'usage: %s [--update]' % sys.argv[0]
+        return 2
+
+    if check():
+        return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+BEGIN TRANSACTION;
+CREATE TABLE mork_columns (table_name TEXT, name TEXT, mork_column TEXT);
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','DisplayName','DisplayName');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','FirstName','FirstName');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','LastModifiedDate','LastModifiedDate');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','LastName','LastName');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','ListName','ListName');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','Notes','Notes');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','PopularityIndex','PopularityIndex');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','PreferMailFormat','PreferMailFormat');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','PrimaryEmail','PrimaryEmail');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:card:all-1','RecordKey','RecordKey');
+INSERT INTO "mork_columns" VALUES('ns:addrbk:db:row:scope:data:all-1','LastRecordKey','LastRecordKey');
+CREATE TABLE mork_dicts (namespace TEXT, id TEXT, value);
+INSERT INTO "mork_dicts" VALUES('a','0','');
+INSERT INTO "mork_dicts" VALUES('a','1','');
+INSERT INTO "mork_dicts" VALUES('a','10','');
+INSERT INTO "mork_dicts" VALUES('a','11','');
+INSERT INTO "mork_dicts" VALUES('a','12','');
+INSERT INTO "mork_dicts" VALUES('a','13','');
+INSERT INTO "mork_dicts" VALUES('a','14','');
+INSERT INTO "mork_dicts" VALUES('a','15','');
+INSERT INTO "mork_dicts" VALUES('a','16','');
+INSERT INTO "mork_dicts" VALUES('a','17','');
+INSERT INTO "mork_dicts" VALUES('a','18','');
+INSERT INTO "mork_dicts" VALUES('a','19','');
+INSERT INTO "mork_dicts" VALUES('a','1A','');
+INSERT INTO "mork_dicts" VALUES('a','1B','');
+INSERT INTO "mork_dicts" VALUES('a','1C','');
+INSERT INTO "mork_dicts" VALUES('a','1D','');
+INSERT INTO "mork_dicts" VALUES('a','1E','');
+INSERT INTO "mork_dicts" VALUES('a','1F','');
+INSERT INTO "mork_dicts" VALUES('a','2','');
+INSERT INTO "mork_dicts" VALUES('a','20',' ');
+INSERT INTO "mork_dicts" VALUES('a','21','!');
+INSERT INTO "mork_dicts" VALUES('a','22','"');
+INSERT INTO "mork_dicts" VALUES('a','23','#');
+INSERT INTO "mork_dicts" VALUES('a','24','$');
+INSERT INTO "mork_dicts" VALUES('a','25','%');
+INSERT INTO "mork_dicts" VALUES('a','26','&');
+INSERT INTO "mork_dicts" VALUES('a','27','''');
+INSERT INTO "mork_dicts" VALUES('a','28','(');
+INSERT INTO "mork_dicts" VALUES('a','29',')');
+INSERT INTO "mork_dicts" VALUES('a','2A','*');
+INSERT INTO "mork_dicts" VALUES('a','2B','+');
+INSERT INTO "mork_dicts" VALUES('a','2C',',');
+INSERT INTO "mork_dicts" VALUES('a','2D','-');
+INSERT INTO "mork_dicts" VALUES('a','2E','.');
+INSERT INTO "mork_dicts" VALUES('a','2F','/');
+INSERT INTO "mork_dicts" VALUES('a','3','');
+INSERT INTO "mork_dicts" VALUES('a','30','0');
+INSERT INTO "mork_dicts" VALUES('a','31','1');
+INSERT INTO "mork_dicts" VALUES('a','32','2');
+INSERT INTO "mork_dicts" VALUES('a','33','3');
+INSERT INTO "mork_dicts" VALUES('a','34','4');
+INSERT INTO "mork_dicts" VALUES('a','35','5');
+INSERT INTO "mork_dicts" VALUES('a','36','6');
+INSERT INTO "mork_dicts" VALUES('a','37','7');
+INSERT INTO "mork_dicts" VALUES('a','38','8');
+INSERT INTO "mork_dicts" VALUES('a','39','9');
+INSERT INTO "mork_dicts" VALUES('a','3A',':');
+INSERT INTO "mork_dicts" VALUES('a','3B',';');
+INSERT INTO "mork_dicts" VALUES('a','3C','<');
+INSERT INTO "mork_dicts" VALUES('a','3D','=');
+INSERT INTO "mork_dicts" VALUES('a','3E','>');
+INSERT INTO "mork_dicts" VALUES('a','3F','?');
+INSERT INTO "mork_dicts" VALUES('a','4','');
+INSERT INTO "mork_dicts" VALUES('a','40','@');
+INSERT INTO "mork_dicts" VALUES('a','41','A');
+INSERT INTO "mork_dicts" VALUES('a','42','B');
+INSERT INTO "mork_dicts" VALUES('a','43','C');
+INSERT INTO "mork_dicts" VALUES('a','44','D');
+INSERT INTO "mork_dicts" VALUES('a','45','E');
+INSERT INTO "mork_dicts" VALUES('a','46','F');
+INSERT INTO "mork_dicts" VALUES('a','47','G');
+INSERT INTO "mork_dicts" VALUES('a','48','H');
+INSERT INTO "mork_dicts" VALUES('a','49','I');
+INSERT INTO "mork_dicts" VALUES('a','4A','J');
+INSERT INTO "mork_dicts" VALUES('a','4B','K');
+INSERT INTO "mork_dicts" VALUES('a','4C','L');
+INSERT INTO "mork_dicts" VALUES('a','4D','M');
+INSERT INTO "mork_dicts" VALUES('a','4E','N');
+INSERT INTO "mork_dicts" VALUES('a','4F','O');
+INSERT INTO "mork_dicts" VALUES('a','5','');
+INSERT INTO "mork_dicts" VALUES('a','50','P');
+INSERT INTO "mork_dicts" VALUES('a','51','Q');
+INSERT INTO "mork_dicts" VALUES('a','52','R');
+INSERT INTO "mork_dicts" VALUES('a','53','S');
+INSERT INTO "mork_dicts" VALUES('a','54','T');
+INSERT INTO "mork_dicts" VALUES('a','55','U');
+INSERT INTO "mork_dicts" VALUES('a','56','V');
+INSERT INTO "mork_dicts" VALUES('a','57','W');
+INSERT INTO "mork_dicts" VALUES('a','58','X');
+INSERT INTO "mork_dicts" VALUES('a','59','Y');
+INSERT INTO "mork_dicts" VALUES('a','5A','Z');
+INSERT INTO "mork_dicts" VALUES('a','5B','[');
+INSERT INTO "mork_dicts" VALUES('a','5C','\');
+INSERT INTO "mork_dicts" VALUES('a','5D',']');
+INSERT INTO "mork_dicts" VALUES('a','5E','^');
+INSERT INTO "mork_dicts" VALUES('a','5F','_');
+INSERT INTO "mork_dicts" VALUES('a','6','');
+INSERT INTO "mork_dicts" VALUES('a','60','`');
+INSERT INTO "mork_dicts" VALUES('a','61','a');
+INSERT INTO "mork_dicts" VALUES('a','62','b');
+INSERT INTO "mork_dicts" VALUES('a','63','c');
+INSERT INTO "mork_dicts" VALUES('a','64','d');
+INSERT INTO "mork_dicts" VALUES('a','65','e');
+INSERT INTO "mork_dicts" VALUES('a','66','f');
+INSERT INTO "mork_dicts" VALUES('a','67','g');
+INSERT INTO "mork_dicts" VALUES('a','68','h');
+INSERT INTO "mork_dicts" VALUES('a','69','i');
+INSERT INTO "mork_dicts" VALUES('a','6A','j');
+INSERT INTO "mork_dicts" VALUES('a','6B','k');
+INSERT INTO "mork_dicts" VALUES('a','6C','l');
+INSERT INTO "mork_dicts" VALUES('a','6D','m');
+INSERT INTO "mork_dicts" VALUES('a','6E','n');
+INSERT INTO "mork_dicts" VALUES('a','6F','o');
+INSERT INTO "mork_dicts" VALUES('a','7','');
+INSERT INTO "mork_dicts" VALUES('a','70','p');
+INSERT INTO "mork_dicts" VALUES('a','71','q');
+INSERT INTO "mork_dicts" VALUES('a','72','r');
+INSERT INTO "mork_dicts" VALUES('a','73','s');
+INSERT INTO "mork_dicts" VALUES('a','74','t');
+INSERT INTO "mork_dicts" VALUES('a','75','u');
+INSERT INTO "mork_dicts" VALUES('a','76','v');
+INSERT INTO "mork_dicts" VALUES('a','77','w');
+INSERT INTO "mork_dicts" VALUES('a','78','x');
+INSERT INTO "mork_dicts" VALUES('a','79','y');
+INSERT INTO "mork_dicts" VALUES('a','7A','z');
+INSERT INTO "mork_dicts" VALUES('a','7B','{');
+INSERT INTO "mork_dicts" VALUES('a','7C','|');
+INSERT INTO "mork_dicts" VALUES('a','7D','}');
+INSERT INTO "mork_dicts" VALUES('a','7E','~');
+INSERT INTO "mork_dicts" VALUES('a','7F','');
+INSERT INTO "mork_dicts" VALUES('a','8','');
+INSERT INTO "mork_dicts" VALUES('a','9','	');
+INSERT INTO "mork_dicts" VALUES('a','90','Ann');
+INSERT INTO "mork_dicts" VALUES('a','91','Lee');
+INSERT INTO "mork_dicts" VALUES('a','92','Ann Lee');
+INSERT INTO "mork_dicts" VALUES('a','93','ann@example.com');
+INSERT INTO "mork_dicts" VALUES('a','94','4cb9f0a2');
+INSERT INTO "mork_dicts" VALUES('a','95','0');
+INSERT INTO "mork_dicts" VALUES('a','96','José');
+INSERT INTO "mork_dicts" VALUES('a','97','Ramos');
+INSERT INTO "mork_dicts" VALUES('a','98','José Ramos');
+INSERT INTO "mork_dicts" VALUES('a','99','jose@example.com');
+INSERT INTO "mork_dicts" VALUES('a','9A','1');
+INSERT INTO "mork_dicts" VALUES('a','9B','3');
+INSERT INTO "mork_dicts" VALUES('a','9C','Met at (the) conference');
+INSERT INTO "mork_dicts" VALUES('a','9D','Friends');
+INSERT INTO "mork_dicts" VALUES('a','9E','2');
+INSERT INTO "mork_dicts" VALUES('a','9F','4cba0b17');
+INSERT INTO "mork_dicts" VALUES('a','A','
+');
+INSERT INTO "mork_dicts" VALUES('a','A0','1');
+INSERT INTO "mork_dicts" VALUES('a','B','');
+INSERT INTO "mork_dicts" VALUES('a','C','');
+INSERT INTO "mork_dicts" VALUES('a','D','');
+INSERT INTO "mork_dicts" VALUES('a','E','');
+INSERT INTO "mork_dicts" VALUES('a','F','');
+INSERT INTO "mork_dicts" VALUES('c','0','');
+INSERT INTO "mork_dicts" VALUES('c','1','');
+INSERT INTO "mork_dicts" VALUES('c','10','');
+INSERT INTO "mork_dicts" VALUES('c','11','');
+INSERT INTO "mork_dicts" VALUES('c','12','');
+INSERT INTO "mork_dicts" VALUES('c','13','');
+INSERT INTO "mork_dicts" VALUES('c','14','');
+INSERT INTO "mork_dicts" VALUES('c','15','');
+INSERT INTO "mork_dicts" VALUES('c','16','');
+INSERT INTO "mork_dicts" VALUES('c','17','');
+INSERT INTO "mork_dicts" VALUES('c','18','');
+INSERT INTO "mork_dicts" VALUES('c','19','');
+INSERT INTO "mork_dicts" VALUES('c','1A','');
+INSERT INTO "mork_dicts" VALUES('c','1B','');
+INSERT INTO "mork_dicts" VALUES('c','1C','');
+INSERT INTO "mork_dicts" VALUES('c','1D','');
+INSERT INTO "mork_dicts" VALUES('c','1E','');
+INSERT INTO "mork_dicts" VALUES('c','1F','');
+INSERT INTO "mork_dicts" VALUES('c','2','');
+INSERT INTO "mork_dicts" VALUES('c','20',' ');
+INSERT INTO "mork_dicts" VALUES('c','21','!');
+INSERT INTO "mork_dicts" VALUES('c','22','"');
+INSERT INTO "mork_dicts" VALUES('c','23','#');
+INSERT INTO "mork_dicts" VALUES('c','24','$');
+INSERT INTO "mork_dicts" VALUES('c','25','%');
+INSERT INTO "mork_dicts" VALUES('c','26','&');
+INSERT INTO "mork_dicts" VALUES('c','27','''');
+INSERT INTO "mork_dicts" VALUES('c','28','(');
+INSERT INTO "mork_dicts" VALUES('c','29',')');
+INSERT INTO "mork_dicts" VALUES('c','2A','*');
+INSERT INTO "mork_dicts" VALUES('c','2B','+');
+INSERT INTO "mork_dicts" VALUES('c','2C',',');
+INSERT INTO "mork_dicts" VALUES('c','2D','-');
+INSERT INTO "mork_dicts" VALUES('c','2E','.');
+INSERT INTO "mork_dicts" VALUES('c','2F','/');
+INSERT INTO "mork_dicts" VALUES('c','3','');
+INSERT INTO "mork_dicts" VALUES('c','30','0');
+INSERT INTO "mork_dicts" VALUES('c','31','1');
+INSERT INTO "mork_dicts" VALUES('c','32','2');
+INSERT INTO "mork_dicts" VALUES('c','33','3');
+INSERT INTO "mork_dicts" VALUES('c','34','4');
+INSERT INTO "mork_dicts" VALUES('c','35','5');
+INSERT INTO "mork_dicts" VALUES('c','36','6');
+INSERT INTO "mork_dicts" VALUES('c','37','7');
+INSERT INTO "mork_dicts" VALUES('c','38','8');
+INSERT INTO "mork_dicts" VALUES('c','39','9');
+INSERT INTO "mork_dicts" VALUES('c','3A',':');
+INSERT INTO "mork_dicts" VALUES('c','3B',';');
+INSERT INTO "mork_dicts" VALUES('c','3C','<');
+INSERT INTO "mork_dicts" VALUES('c','3D','=');
+INSERT INTO "mork_dicts" VALUES('c','3E','>');
+INSERT INTO "mork_dicts" VALUES('c','3F','?');
+INSERT INTO "mork_dicts" VALUES('c','4','');
+INSERT INTO "mork_dicts" VALUES('c','40','@');
+INSERT INTO "mork_dicts" VALUES('c','41','A');
+INSERT INTO "mork_dicts" VALUES('c','42','B');
+INSERT INTO "mork_dicts" VALUES('c','43','C');
+INSERT INTO "mork_dicts" VALUES('c','44','D');
+INSERT INTO "mork_dicts" VALUES('c','45','E');
+INSERT INTO "mork_dicts" VALUES('c','46','F');
+INSERT INTO "mork_dicts" VALUES('c','47','G');
+INSERT INTO "mork_dicts" VALUES('c','48','H');
+INSERT INTO "mork_dicts" VALUES('c','49','I');
+INSERT INTO "mork_dicts" VALUES('c','4A','J');
+INSERT INTO "mork_dicts" VALUES('c','4B','K');
+INSERT INTO "mork_dicts" VALUES('c','4C','L');
+INSERT INTO "mork_dicts" VALUES('c','4D','M');
+INSERT INTO "mork_dicts" VALUES('c','4E','N');
+INSERT INTO "mork_dicts" VALUES('c','4F','O');
+INSERT INTO "mork_dicts" VALUES('c','5','');
+INSERT INTO "mork_dicts" VALUES('c','50','P');
+INSERT INTO "mork_dicts" VALUES('c','51','Q');
+INSERT INTO "mork_dicts" VALUES('c','52','R');
+INSERT INTO "mork_dicts" VALUES('c','53','S');
+INSERT INTO "mork_dicts" VALUES('c','54','T');
+INSERT INTO "mork_dicts" VALUES('c','55','U');
+INSERT INTO "mork_dicts" VALUES('c','56','V');
+INSERT INTO "mork_dicts" VALUES('c','57','W');
+INSERT INTO "mork_dicts" VALUES('c','58','X');
+INSERT INTO "mork_dicts" VALUES('c','59','Y');
+INSERT INTO "mork_dicts" VALUES('c','5A','Z');
+INSERT INTO "mork_dicts" VALUES('c','5B','[');
+INSERT INTO "mork_dicts" VALUES('c','5C','\');
+INSERT INTO "mork_dicts" VALUES('c','5D',']');
+INSERT INTO "mork_dicts" VALUES('c','5E','^');
+INSERT INTO "mork_dicts" VALUES('c','5F','_');
+INSERT INTO "mork_dicts" VALUES('c','6','');
+INSERT INTO "mork_dicts" VALUES('c','60','`');
+INSERT INTO "mork_dicts" VALUES('c','61','a');
+INSERT INTO "mork_dicts" VALUES('c','62','b');
+INSERT INTO "mork_dicts" VALUES('c','63','c');
+INSERT INTO "mork_dicts" VALUES('c','64','d');
+INSERT INTO "mork_dicts" VALUES('c','65','e');
+INSERT INTO "mork_dicts" VALUES('c','66','f');
+INSERT INTO "mork_dicts" VALUES('c','67','g');
+INSERT INTO "mork_dicts" VALUES('c','68','h');
+INSERT INTO "mork_dicts" VALUES('c','69','i');
+INSERT INTO "mork_dicts" VALUES('c','6A','j');
+INSERT INTO "mork_dicts" VALUES('c','6B','k');
+INSERT INTO "mork_dicts" VALUES('c','6C','l');
+INSERT INTO "mork_dicts" VALUES('c','6D','m');
+INSERT INTO "mork_dicts" VALUES('c','6E','n');
+INSERT INTO "mork_dicts" VALUES('c','6F','o');
+INSERT INTO "mork_dicts" VALUES('c','7','');
+INSERT INTO "mork_dicts" VALUES('c','70','p');
+INSERT INTO "mork_dicts" VALUES('c','71','q');
+INSERT INTO "mork_dicts" VALUES('c','72','r');
+INSERT INTO "mork_dicts" VALUES('c','73','s');
+INSERT INTO "mork_dicts" VALUES('c','74','t');
+INSERT INTO "mork_dicts" VALUES('c','75','u');
+INSERT INTO "mork_dicts" VALUES('c','76','v');
+INSERT INTO "mork_dicts" VALUES('c','77','w');
+INSERT INTO "mork_dicts" VALUES('c','78','x');
+INSERT INTO "mork_dicts" VALUES('c','79','y');
+INSERT INTO "mork_dicts" VALUES('c','7A','z');
+INSERT INTO "mork_dicts" VALUES('c','7B','{');
+INSERT INTO "mork_dicts" VALUES('c','7C','|');
+INSERT INTO "mork_dicts" VALUES('c','7D','}');
+INSERT INTO "mork_dicts" VALUES('c','7E','~');
+INSERT INTO "mork_dicts" VALUES('c','7F','');
+INSERT INTO "mork_dicts" VALUES('c','8','');
+INSERT INTO "mork_dicts" VALUES('c','80','FirstName');
+INSERT INTO "mork_dicts" VALUES('c','81','LastName');
+INSERT INTO "mork_dicts" VALUES('c','82','DisplayName');
+INSERT INTO "mork_dicts" VALUES('c','83','PrimaryEmail');
+INSERT INTO "mork_dicts" VALUES('c','84','LastModifiedDate');
+INSERT INTO "mork_dicts" VALUES('c','85','PreferMailFormat');
+INSERT INTO "mork_dicts" VALUES('c','86','PopularityIndex');
+INSERT INTO "mork_dicts" VALUES('c','87','Notes');
+INSERT INTO "mork_dicts" VALUES('c','88','ListName');
+INSERT INTO "mork_dicts" VALUES('c','89','LastRecordKey');
+INSERT INTO "mork_dicts" VALUES('c','8A','RecordKey');
+INSERT INTO "mork_dicts" VALUES('c','9','	');
+INSERT INTO "mork_dicts" VALUES('c','A','
+');
+INSERT INTO "mork_dicts" VALUES('c','B','');
+INSERT INTO "mork_dicts" VALUES('c','B8','ns:addrbk:db:row:scope:card:all');
+INSERT INTO "mork_dicts" VALUES('c','B9','ns:addrbk:db:table:kind:pab');
+INSERT INTO "mork_dicts" VALUES('c','BA','ns:addrbk:db:row:scope:list:all');
+INSERT INTO "mork_dicts" VALUES('c','BB','ns:addrbk:db:row:scope:data:all');
+INSERT INTO "mork_dicts" VALUES('c','C','');
+INSERT INTO "mork_dicts" VALUES('c','D','');
+INSERT INTO "mork_dicts" VALUES('c','E','');
+INSERT INTO "mork_dicts" VALUES('c','F','');
+CREATE TABLE mork_meta_cells (table_namespace TEXT, table_id TEXT, mork_column TEXT, value);
+INSERT INTO "mork_meta_cells" VALUES('ns:addrbk:db:row:scope:card:all','1','k','ns:addrbk:db:table:kind:pab');
+INSERT INTO "mork_meta_cells" VALUES('ns:addrbk:db:row:scope:card:all','1','s','9');
+INSERT INTO "mork_meta_cells" VALUES('ns:addrbk:db:row:scope:data:all','1','k','ns:addrbk:db:table:kind:pab');
+INSERT INTO "mork_meta_cells" VALUES('ns:addrbk:db:row:scope:data:all','1','s','9');
+CREATE TABLE mork_meta_rows (table_namespace TEXT, table_id TEXT, row_namespace TEXT, row_id TEXT, mork_column TEXT, value);
+CREATE TABLE mork_tables (name TEXT PRIMARY KEY, namespace TEXT, id TEXT);
+INSERT INTO "mork_tables" VALUES('ns:addrbk:db:row:scope:card:all-1','ns:addrbk:db:row:scope:card:all','1');
+INSERT INTO "mork_tables" VALUES('ns:addrbk:db:row:scope:data:all-1','ns:addrbk:db:row:scope:data:all','1');
+CREATE TABLE "ns:addrbk:db:row:scope:card:all-1" (row_namespace TEXT, row_id TEXT, "DisplayName", "FirstName", "LastModifiedDate", "LastName", "ListName", "Notes", "PopularityIndex", "PreferMailFormat", "PrimaryEmail", "RecordKey");
+INSERT INTO "ns:addrbk:db:row:scope:card:all-1" VALUES('ns:addrbk:db:row:scope:card:all','1','Ann Lee','Ann','Sat Oct 16 18:36:18 2010','Lee',NULL,NULL,'0','unknown','ann@example.com','1');
+INSERT INTO "ns:addrbk:db:row:scope:card:all-1" VALUES('ns:addrbk:db:row:scope:card:all','2','José Ramos','José','Sat Oct 16 20:29:11 2010','Ramos',NULL,'Met at (the) conference','3','html','jose@example.com','2');
+INSERT INTO "ns:addrbk:db:row:scope:card:all-1" VALUES('ns:addrbk:db:row:scope:list:all','1',NULL,NULL,'4cb9f0a2',NULL,'Friends',NULL,NULL,NULL,NULL,NULL);
+CREATE TABLE "ns:addrbk:db:row:scope:data:all-1" (row_namespace TEXT, row_id TEXT, "LastRecordKey");
+INSERT INTO "ns:addrbk:db:row:scope:data:all-1" VALUES('ns:addrbk:db:row:scope:data:all','1','2');
+CREATE INDEX "mork_index_0" ON "ns:addrbk:db:row:scope:data:all-1" (row_namespace, row_id);
+CREATE INDEX "mork_index_1" ON "ns:addrbk:db:row:scope:card:all-1" (row_namespace, row_id);
+COMMIT;